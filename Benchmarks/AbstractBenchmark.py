@@ -0,0 +1,101 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+import Solution as Solution
+import Utility.DBConnector as Connector
+
+'''
+    Benchmarks run against the database configured in Utility/database.ini
+    run them from the repository root, e.g. python -m Benchmarks.PreparedStatementsBenchmark
+    every benchmark drops and re-creates the tables, do not point it at a database you care about
+'''
+
+
+class AbstractBenchmark:
+    # before the benchmark, a fresh schema is created
+    def setUp(self) -> None:
+        Solution.drop_tables()
+        Solution.create_tables()
+
+    # after the benchmark, the schema is dropped
+    def tearDown(self) -> None:
+        Solution.drop_tables()
+
+    # runs fn(i) for i in range(calls) and returns the average latency per call in microseconds
+    @staticmethod
+    def measure(label: str, fn, calls: int) -> float:
+        start = time.perf_counter()
+        for i in range(calls):
+            fn(i)
+        elapsed = time.perf_counter() - start
+        per_call = elapsed * 1e6 / calls
+        print(f'{label:<50} {calls:>8} calls  {elapsed:>9.3f}s  {per_call:>9.1f}us/call')
+        return per_call
+
+    # runs fn() once and returns the elapsed time in milliseconds
+    @staticmethod
+    def measure_once(label: str, fn) -> float:
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1e3
+        print(f'{label:<50} {elapsed:>9.1f}ms')
+        return elapsed
+
+    # fills the tables with a synthetic dataset through COPY:
+    # orders are spread over `years` years starting 2015, 10% of them are anonymous,
+    # every order holds 1..2*items_per_order-1 distinct dishes, and ratings are unique (cust_id, dish_id) pairs
+    @staticmethod
+    def populate(customers: int, dishes: int, orders: int, items_per_order: int = 3, ratings: int = 0,
+                 years: int = 10, seed: int = 236363) -> None:
+        rnd = random.Random(seed)
+        start = datetime(2015, 1, 1)
+        span = int(timedelta(days=365 * years).total_seconds())
+        prices = {dish_id: rnd.randint(10, 100) for dish_id in range(1, dishes + 1)}
+
+        def copy(table, columns, rows):
+            with Connector.get_pool().connection() as conn:
+                conn.copy_rows(table, columns, rows)
+                conn.commit()
+
+        copy('Customer', ['cust_id', 'full_name', 'age', 'phone'],
+             ((i, f'customer {i}', rnd.randint(18, 120), '0123456789') for i in range(1, customers + 1)))
+        copy('Dish', ['dish_id', 'name', 'price', 'is_active'],
+             ((i, f'dish {i}', prices[i], rnd.random() < 0.9) for i in range(1, dishes + 1)))
+        copy('Orders', ['order_id', 'date', 'delivery_fee', 'delivery_address'],
+             ((i, (start + timedelta(seconds=rnd.randrange(span))).strftime("%Y-%m-%d %H:%M:%S"),
+               rnd.randint(1, 20), f'address {i}') for i in range(1, orders + 1)))
+        copy('Placed', ['order_id', 'cust_id'],
+             ((i, rnd.randint(1, customers)) for i in range(1, orders + 1) if rnd.random() >= 0.1))
+
+        def order_items():
+            for order_id in range(1, orders + 1):
+                count = min(dishes, rnd.randint(1, 2 * items_per_order - 1))
+                for dish_id in rnd.sample(range(1, dishes + 1), count):
+                    # a share of the line items was sold before the last price change
+                    price = prices[dish_id] if rnd.random() < 0.7 else prices[dish_id] - rnd.randint(1, 9)
+                    yield order_id, dish_id, rnd.randint(1, 5), price
+        copy('OrderedDishes', ['order_id', 'dish_id', 'dish_amount', 'dish_price'], order_items())
+
+        def dish_ratings():
+            seen = set()
+            while len(seen) < min(ratings, customers * dishes):
+                pair = (rnd.randint(1, customers), rnd.randint(1, dishes))
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair[0], pair[1], rnd.randint(1, 5)
+        copy('DishRatings', ['cust_id', 'dish_id', 'rating'], dish_ratings())
+
+        with Connector.get_pool().connection() as conn:
+            conn.execute("ANALYZE")
+            conn.commit()
+
+    def run(self) -> None:
+        raise NotImplementedError
+
+    def main(self) -> None:
+        self.setUp()
+        try:
+            self.run()
+        finally:
+            self.tearDown()
@@ -0,0 +1,71 @@
+from datetime import date
+
+from psycopg2 import sql
+
+import Solution as Solution
+import Utility.DBConnector as Connector
+from Benchmarks.AbstractBenchmark import AbstractBenchmark
+
+'''
+    query plans and timings of the BASIC / ADVANCED API functions on a 1M orders dataset,
+    the plans show whether the secondary indexes created by create_tables are used
+'''
+
+CUSTOMERS = 100000
+DISHES = 500
+ORDERS = 1000000
+RATINGS = 200000
+REPEAT = 5
+
+ANALYTICAL_CALLS = [
+    ('get_order_total_price', lambda: Solution.get_order_total_price(ORDERS // 2)),
+    ('get_customers_spent_max_avg_amount_money', Solution.get_customers_spent_max_avg_amount_money),
+    ('get_most_purchased_dish_among_anonymous_order', Solution.get_most_purchased_dish_among_anonymous_order),
+    ('did_customer_order_top_rated_dishes', lambda: Solution.did_customer_order_top_rated_dishes(CUSTOMERS // 2)),
+    ('get_customers_rated_but_not_ordered', Solution.get_customers_rated_but_not_ordered),
+    ('get_non_worth_price_increase', Solution.get_non_worth_price_increase),
+    ('get_cumulative_profit_per_month', lambda: Solution.get_cumulative_profit_per_month(2020)),
+    ('get_cumulative_profit, 10 years per month',
+     lambda: Solution.get_cumulative_profit(date(2015, 1, 1), date(2024, 12, 31), 'month')),
+    ('get_cumulative_profit, 10 years per week',
+     lambda: Solution.get_cumulative_profit(date(2015, 1, 1), date(2024, 12, 31), 'week')),
+    ('get_potential_dish_recommendations', lambda: Solution.get_potential_dish_recommendations(CUSTOMERS // 2)),
+]
+
+
+# the queries sent by fn, captured by wrapping Solution.handle_query
+def captured_queries(fn) -> list:
+    queries = []
+    original = Solution.handle_query
+
+    def capture(query, *args, **kwargs):
+        queries.append(query)
+        return original(query, *args, **kwargs)
+
+    Solution.handle_query = capture
+    try:
+        fn()
+    finally:
+        Solution.handle_query = original
+    return queries
+
+
+def print_plan(query) -> None:
+    with Connector.get_pool().connection() as conn:
+        _, plan = conn.execute(sql.SQL("EXPLAIN (ANALYZE, BUFFERS) ") + query)
+        for row in plan.rows:
+            print('    ' + row[0])
+
+
+class AnalyticalQueriesBenchmark(AbstractBenchmark):
+    def run(self) -> None:
+        self.measure_once(f'populate {ORDERS} orders', lambda: self.populate(CUSTOMERS, DISHES, ORDERS, ratings=RATINGS))
+        for name, fn in ANALYTICAL_CALLS:
+            print(f'--- {name}')
+            for query in captured_queries(fn):
+                print_plan(query)
+            self.measure(name, lambda i: fn(), REPEAT)
+
+
+if __name__ == '__main__':
+    AnalyticalQueriesBenchmark().main()
@@ -0,0 +1,55 @@
+from psycopg2 import sql
+
+import Solution as Solution
+from Benchmarks.AbstractBenchmark import AbstractBenchmark
+
+'''
+    get_customers_spent_max_avg_amount_money: the original query (the per-customer aggregate computed twice,
+    once for the GROUP BY and once in the HAVING subquery) against the single pass CTE + window rewrite,
+    both must return the same customers
+'''
+
+CUSTOMERS = 100000
+DISHES = 500
+ORDERS = 1000000
+REPEAT = 5
+
+LEGACY_QUERY = sql.SQL('''
+    SELECT Co.cust_id
+    FROM CustomersOrders AS Co JOIN OrdersSum AS Os ON(Co.order_id = Os.order_id)
+    WHERE Co.cust_id IS NOT NULL
+    GROUP BY Co.cust_id
+    HAVING  SUM(Os.total + Os.delivery_fee)/COALESCE(COUNT(*),1) = (
+                SELECT  sum(OrdersSum.total + OrdersSum.delivery_fee)/COALESCE(COUNT(*),1) max
+                FROM CustomersOrders JOIN OrdersSum ON(CustomersOrders.order_id = OrdersSum.order_id)
+                WHERE  CustomersOrders.cust_id IS NOT NULL
+                GROUP BY CustomersOrders.cust_id
+                ORDER BY SUM(OrdersSum.total + OrdersSum.delivery_fee)/COALESCE(COUNT(*),1) DESC
+                LIMIT 1 )
+    ORDER BY Co.cust_id ASC
+''')
+
+
+def legacy_customers_spent_max_avg_amount_money() -> list:
+    _, _, data, _ = Solution.handle_query(LEGACY_QUERY)
+    return [row['cust_id'] for row in data]
+
+
+class MaxAverageSpendBenchmark(AbstractBenchmark):
+    def run(self) -> None:
+        self.measure_once(f'populate {ORDERS} orders', lambda: self.populate(CUSTOMERS, DISHES, ORDERS))
+
+        expected = legacy_customers_spent_max_avg_amount_money()
+        actual = Solution.get_customers_spent_max_avg_amount_money()
+        assert expected == actual, f'results differ: {expected} != {actual}'
+        print(f'both queries return {actual}')
+
+        before = self.measure('legacy GROUP BY + HAVING subquery (before)',
+                              lambda i: legacy_customers_spent_max_avg_amount_money(), REPEAT)
+        after = self.measure('CTE + MAX() OVER () (after)',
+                             lambda i: Solution.get_customers_spent_max_avg_amount_money(), REPEAT)
+        print(f'speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    MaxAverageSpendBenchmark().main()
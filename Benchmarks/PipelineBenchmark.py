@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import Solution as Solution
+from Business.Order import Order
+from Business.Customer import Customer
+from Business.Dish import Dish
+from Benchmarks.AbstractBenchmark import AbstractBenchmark
+
+'''
+    checkout latency: add_order + customer_placed_order + ITEMS x order_contains_dish sent one call at a time
+    (one round trip and one commit each) against the same operations sent through Solution.pipeline()
+'''
+
+CHECKOUTS = 2000
+ITEMS = 5
+DISHES = 50
+
+
+def checkout_operations(order_id: int) -> list:
+    operations = [('add_order', (Order(order_id, datetime(2024, 1, 1), 10, 'address'),)),
+                  ('customer_placed_order', (order_id % 10 + 1, order_id))]
+    operations += [('order_contains_dish', (order_id, (order_id + item) % DISHES + 1, 2)) for item in range(ITEMS)]
+    return operations
+
+
+def sequential_checkout(order_id: int) -> None:
+    for name, args in checkout_operations(order_id):
+        getattr(Solution, name)(*args)
+
+
+class PipelineBenchmark(AbstractBenchmark):
+    def run(self) -> None:
+        for cust_id in range(1, 11):
+            Solution.add_customer(Customer(cust_id, f'customer {cust_id}', 30, '0123456789'))
+        for dish_id in range(1, DISHES + 1):
+            Solution.add_dish(Dish(dish_id, f'dish {dish_id}', 10 + dish_id, True))
+
+        before = self.measure('checkout, one call per statement (before)',
+                              lambda i: sequential_checkout(i + 1), CHECKOUTS)
+        after = self.measure('checkout, pipelined (after)',
+                             lambda i: Solution.pipeline(checkout_operations(CHECKOUTS + i + 1)), CHECKOUTS)
+        print(f'speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    PipelineBenchmark().main()
@@ -0,0 +1,42 @@
+from psycopg2 import sql
+
+import Solution as Solution
+from Business.Customer import Customer
+from Benchmarks.AbstractBenchmark import AbstractBenchmark
+
+'''
+    get_customer latency: the old f-string query (a new text, parsed and planned on every call)
+    against the prepared get_customer statement (planned once per pooled connection)
+'''
+
+CALLS = 100000
+CUSTOMERS = 1000
+
+
+def legacy_get_customer(customer_id: int):
+    query = sql.SQL(f'''
+        SELECT * FROM Customer WHERE cust_id={customer_id}
+    ''')
+    return Solution.handle_query(query)
+
+
+class PreparedStatementsBenchmark(AbstractBenchmark):
+    def run(self) -> None:
+        for cust_id in range(1, CUSTOMERS + 1):
+            Solution.add_customer(Customer(cust_id, f'customer {cust_id}', 30, '0123456789'))
+
+        before = self.measure('get_customer, literal query (before)',
+                              lambda i: legacy_get_customer(i % CUSTOMERS + 1), CALLS)
+        # with the customer cache on, get_customer would time cache hits instead of EXECUTE
+        Solution.configure_caches(customer_size=0)
+        try:
+            after = self.measure('get_customer, prepared statement (after)',
+                                 lambda i: Solution.get_customer(i % CUSTOMERS + 1), CALLS)
+        finally:
+            Solution.configure_caches()
+        print(f'speedup: {before / after:.2f}x')
+        print(f'pool: {Solution.Connector.pool_stats()}')
+
+
+if __name__ == '__main__':
+    PreparedStatementsBenchmark().main()
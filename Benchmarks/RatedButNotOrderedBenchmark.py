@@ -0,0 +1,72 @@
+from psycopg2 import sql
+
+import Solution as Solution
+from Benchmarks.AbstractBenchmark import AbstractBenchmark
+
+'''
+    get_customers_rated_but_not_ordered at 500k ratings: the original correlated NOT IN against the
+    CustomerOrderedDishes view, the NOT EXISTS anti-join rewrite, and the rewrite served from the result cache.
+    all three must return the same customers. the original query averages DishRatings on every call, as the
+    RatingScore view did before it was backed by DishRatingStats
+'''
+
+CUSTOMERS = 100000
+DISHES = 500
+ORDERS = 500000
+RATINGS = 500000
+REPEAT = 5
+CACHED_CALLS = 10000
+
+LEGACY_QUERY = sql.SQL('''
+    SELECT DISTINCT(cust_low_ratings.cust_id) AS cust_id FROM
+    (
+        SELECT cust_id, dish_id FROM DishRatings
+        WHERE rating < 3
+    ) cust_low_ratings
+    WHERE cust_low_ratings.dish_id IN (
+        SELECT Dish.dish_id
+            FROM Dish LEFT OUTER JOIN DishRatings ON (Dish.dish_id = DishRatings.dish_id)
+            GROUP BY Dish.dish_id
+            ORDER BY COALESCE(AVG(DishRatings.rating), 3) ASC, Dish.dish_id ASC
+            LIMIT 5
+    )
+    AND cust_low_ratings.dish_id NOT IN
+    (
+        SELECT cd.dish_id FROM CustomerOrderedDishes cd
+        WHERE cd.cust_id = cust_low_ratings.cust_id
+    ) ORDER BY cust_id ASC;
+''')
+
+
+def legacy_customers_rated_but_not_ordered() -> list:
+    _, _, data, _ = Solution.handle_query(LEGACY_QUERY)
+    return [row['cust_id'] for row in data]
+
+
+class RatedButNotOrderedBenchmark(AbstractBenchmark):
+    def run(self) -> None:
+        self.measure_once(f'populate {RATINGS} ratings', lambda: self.populate(CUSTOMERS, DISHES, ORDERS, ratings=RATINGS))
+
+        expected = legacy_customers_rated_but_not_ordered()
+        actual = Solution.get_customers_rated_but_not_ordered()
+        assert expected == actual, f'results differ: {len(expected)} != {len(actual)} customers'
+        print(f'both queries return {len(actual)} customers')
+
+        before = self.measure('correlated NOT IN (before)', lambda i: legacy_customers_rated_but_not_ordered(), REPEAT)
+        after = self.measure('NOT EXISTS anti-join (after)', lambda i: Solution.get_customers_rated_but_not_ordered(),
+                             REPEAT)
+        print(f'speedup: {before / after:.2f}x')
+
+        Solution.configure_caches(result_size=16)
+        try:
+            assert Solution.get_customers_rated_but_not_ordered() == expected
+            cached = self.measure('anti-join, result cache (after)',
+                                  lambda i: Solution.get_customers_rated_but_not_ordered(), CACHED_CALLS)
+            print(f'cached speedup: {before / cached:.2f}x')
+            print(f'result cache: {Solution.cache_stats()["result"]}')
+        finally:
+            Solution.configure_caches()
+
+
+if __name__ == '__main__':
+    RatedButNotOrderedBenchmark().main()
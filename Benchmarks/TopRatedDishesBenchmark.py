@@ -0,0 +1,41 @@
+import Solution as Solution
+from Benchmarks.AbstractBenchmark import AbstractBenchmark
+
+'''
+    a loyalty campaign checking every customer with did_customer_order_top_rated_dishes: one call per customer
+    (the top 5 recomputed every time), the batched variant, and single calls served from the cached bitmap
+'''
+
+CUSTOMERS = 10000
+DISHES = 500
+ORDERS = 200000
+RATINGS = 100000
+
+
+class TopRatedDishesBenchmark(AbstractBenchmark):
+    def run(self) -> None:
+        self.measure_once(f'populate {ORDERS} orders', lambda: self.populate(CUSTOMERS, DISHES, ORDERS, ratings=RATINGS))
+        cust_ids = list(range(1, CUSTOMERS + 1))
+
+        expected = [Solution.did_customer_order_top_rated_dishes(cust_id) for cust_id in cust_ids]
+        assert expected == Solution.did_customers_order_top_rated_dishes(cust_ids)
+
+        before = self.measure_once('one call per customer (before)',
+                                   lambda: [Solution.did_customer_order_top_rated_dishes(c) for c in cust_ids])
+        after = self.measure_once('did_customers_order_top_rated_dishes (after)',
+                                  lambda: Solution.did_customers_order_top_rated_dishes(cust_ids))
+        print(f'speedup: {before / after:.2f}x')
+
+        Solution.configure_caches(result_size=16)
+        try:
+            Solution.did_customers_order_top_rated_dishes(cust_ids)
+            cached = self.measure_once('one call per customer, cached bitmap (after)',
+                                       lambda: [Solution.did_customer_order_top_rated_dishes(c) for c in cust_ids])
+            assert expected == [Solution.did_customer_order_top_rated_dishes(c) for c in cust_ids]
+            print(f'cached speedup: {before / cached:.2f}x')
+        finally:
+            Solution.configure_caches()
+
+
+if __name__ == '__main__':
+    TopRatedDishesBenchmark().main()
@@ -10,6 +10,7 @@ def dropTable() -> None:
     try:
         conn = Connector.DBConnector()
         conn.execute("DROP TABLE IF EXISTS Users CASCADE")
+        conn.commit()
     except DatabaseException.ConnectionInvalid as e:
         # do stuff
         print(e)
@@ -37,6 +38,7 @@ def createTable() -> None:
     try:
         conn = Connector.DBConnector()
         conn.execute("CREATE TABLE Users(id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+        conn.commit()
     except DatabaseException.ConnectionInvalid as e:
         print(e)
     except DatabaseException.NOT_NULL_VIOLATION as e:
@@ -85,6 +87,7 @@ def addUser(ID: int, name: str) -> ReturnValue:
         query = sql.SQL("INSERT INTO Users(id, name) VALUES({id}, {username})").format(id=sql.Literal(ID),
                                                                                        username=sql.Literal(name))
         rows_effected, _ = conn.execute(query)
+        conn.commit()
     except DatabaseException.ConnectionInvalid as e:
         print(e)
     except DatabaseException.NOT_NULL_VIOLATION as e:
@@ -109,6 +112,7 @@ def deleteUser(ID: int) -> int:
         conn = Connector.DBConnector()
         query = sql.SQL("DELETE FROM Users WHERE id={0}").format(sql.Literal(ID))
         rows_effected, _ = conn.execute(query)
+        conn.commit()
     except DatabaseException.ConnectionInvalid as e:
         print(e)
     except DatabaseException.NOT_NULL_VIOLATION as e:
@@ -1,7 +1,10 @@
-from typing import List, Tuple
+from typing import List, Tuple, Iterable, Callable, Iterator, NamedTuple
+from array import array
 from psycopg2 import sql
-from datetime import date, datetime
+from datetime import date, datetime, MINYEAR, MAXYEAR
+from calendar import monthrange
 import Utility.DBConnector as Connector
+import Utility.Cache as Cache
 from Utility.ReturnValue import ReturnValue
 from Utility.Exceptions import DatabaseException
 from Business.Customer import Customer, BadCustomer
@@ -9,6 +12,10 @@ from Business.Order import Order, BadOrder
 from Business.Dish import Dish, BadDish
 from Business.OrderDish import OrderDish
 from datetime import datetime
+from itertools import islice
+import re
+from contextlib import contextmanager
+import threading
 
 DEBUG_FLAG = False
 
@@ -97,17 +104,610 @@ CREATE TABLE DishRatings
 );
 '''
 
+# ------------------------------- Maintained Aggregates -------------------------------
+# sum of dish_price * dish_amount per order, kept current by triggers on Orders and OrderedDishes
+CREATE_ORDER_TOTALS_TABLE_QUERY = '''
+CREATE TABLE OrderTotals
+(
+    order_id    INTEGER     NOT NULL,
+    total       DECIMAL     NOT NULL DEFAULT 0,
+    PRIMARY KEY (order_id),
+    FOREIGN KEY (order_id) REFERENCES Orders(order_id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION order_totals_on_order_insert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO OrderTotals(order_id, total) VALUES (NEW.order_id, 0);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER order_totals_on_order_insert
+    AFTER INSERT ON Orders
+    FOR EACH ROW EXECUTE FUNCTION order_totals_on_order_insert();
+
+CREATE OR REPLACE FUNCTION order_totals_on_item_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE OrderTotals SET total = total - OLD.dish_price * OLD.dish_amount WHERE order_id = OLD.order_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE OrderTotals SET total = total + NEW.dish_price * NEW.dish_amount WHERE order_id = NEW.order_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER order_totals_on_item_change
+    AFTER INSERT OR UPDATE OR DELETE ON OrderedDishes
+    FOR EACH ROW EXECUTE FUNCTION order_totals_on_item_change();
+'''
+
+# sum and count of the ratings per dish, kept current by triggers on Dish and DishRatings.
+# avg_rating matches COALESCE(AVG(rating), 3) and is indexed in both directions for the top-5 / bottom-5 lookups
+CREATE_DISH_RATING_STATS_TABLE_QUERY = '''
+CREATE TABLE DishRatingStats
+(
+    dish_id         INTEGER     NOT NULL,
+    rating_sum      INTEGER     NOT NULL DEFAULT 0,
+    rating_count    INTEGER     NOT NULL DEFAULT 0,
+    avg_rating      DECIMAL     GENERATED ALWAYS AS
+                        (CASE WHEN rating_count = 0 THEN 3 ELSE rating_sum::DECIMAL / rating_count END) STORED,
+    PRIMARY KEY (dish_id),
+    FOREIGN KEY (dish_id) REFERENCES Dish(dish_id) ON DELETE CASCADE
+);
+
+CREATE INDEX dish_rating_stats_top_idx ON DishRatingStats (avg_rating DESC, dish_id ASC);
+CREATE INDEX dish_rating_stats_bottom_idx ON DishRatingStats (avg_rating ASC, dish_id ASC);
+
+CREATE OR REPLACE FUNCTION dish_rating_stats_on_dish_insert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO DishRatingStats(dish_id) VALUES (NEW.dish_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_rating_stats_on_dish_insert
+    AFTER INSERT ON Dish
+    FOR EACH ROW EXECUTE FUNCTION dish_rating_stats_on_dish_insert();
+
+CREATE OR REPLACE FUNCTION dish_rating_stats_on_rating_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE DishRatingStats SET rating_sum = rating_sum - OLD.rating, rating_count = rating_count - 1
+        WHERE dish_id = OLD.dish_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE DishRatingStats SET rating_sum = rating_sum + NEW.rating, rating_count = rating_count + 1
+        WHERE dish_id = NEW.dish_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_rating_stats_on_rating_change
+    AFTER INSERT OR UPDATE OR DELETE ON DishRatings
+    FOR EACH ROW EXECUTE FUNCTION dish_rating_stats_on_rating_change();
+'''
+
+# DishPriceHistory records every price a dish had, from its insertion and every price update.
+# DishPriceStats keeps the running sum and count of the ordered amounts per (dish, line item price), which is
+# what the appo view used to aggregate from all of OrderedDishes; a row is removed when its last line item is
+CREATE_DISH_PRICE_TABLES_QUERY = '''
+CREATE TABLE DishPriceHistory
+(
+    change_id       INTEGER     GENERATED ALWAYS AS IDENTITY,
+    dish_id         INTEGER     NOT NULL,
+    price           DECIMAL     NOT NULL,
+    changed_at      TIMESTAMP   NOT NULL DEFAULT clock_timestamp(),
+    PRIMARY KEY (change_id),
+    FOREIGN KEY (dish_id) REFERENCES Dish(dish_id) ON DELETE CASCADE
+);
+
+CREATE INDEX dish_price_history_dish_id_idx ON DishPriceHistory (dish_id, change_id);
+
+CREATE TABLE DishPriceStats
+(
+    dish_id         INTEGER     NOT NULL,
+    dish_price      DECIMAL     NOT NULL,
+    amount_sum      BIGINT      NOT NULL,
+    line_count      INTEGER     NOT NULL,
+    PRIMARY KEY (dish_id, dish_price),
+    FOREIGN KEY (dish_id) REFERENCES Dish(dish_id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION dish_price_history_on_price_change() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO DishPriceHistory(dish_id, price) VALUES (NEW.dish_id, NEW.price);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_price_history_on_dish_insert
+    AFTER INSERT ON Dish
+    FOR EACH ROW EXECUTE FUNCTION dish_price_history_on_price_change();
+
+CREATE TRIGGER dish_price_history_on_price_update
+    AFTER UPDATE OF price ON Dish
+    FOR EACH ROW WHEN (OLD.price IS DISTINCT FROM NEW.price)
+    EXECUTE FUNCTION dish_price_history_on_price_change();
+
+CREATE OR REPLACE FUNCTION dish_price_stats_on_item_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE DishPriceStats
+        SET amount_sum = amount_sum - OLD.dish_amount, line_count = line_count - 1
+        WHERE dish_id = OLD.dish_id AND dish_price = OLD.dish_price;
+        DELETE FROM DishPriceStats
+        WHERE dish_id = OLD.dish_id AND dish_price = OLD.dish_price AND line_count = 0;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO DishPriceStats(dish_id, dish_price, amount_sum, line_count)
+        VALUES (NEW.dish_id, NEW.dish_price, NEW.dish_amount, 1)
+        ON CONFLICT (dish_id, dish_price) DO UPDATE
+        SET amount_sum = DishPriceStats.amount_sum + EXCLUDED.amount_sum,
+            line_count = DishPriceStats.line_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_price_stats_on_item_change
+    AFTER INSERT OR UPDATE OR DELETE ON OrderedDishes
+    FOR EACH ROW EXECUTE FUNCTION dish_price_stats_on_item_change();
+'''
+
+# revenue (delivery fees plus line items) per calendar month of the order date, kept current by triggers on
+# Orders and OrderedDishes. an order being deleted takes its whole revenue with it before the line items are
+# cascaded, the line item trigger skips the items whose order is already gone
+CREATE_MONTHLY_REVENUE_TABLE_QUERY = '''
+CREATE TABLE MonthlyRevenue
+(
+    year            INTEGER     NOT NULL,
+    month           INTEGER     NOT NULL,
+    revenue         DECIMAL     NOT NULL DEFAULT 0,
+    PRIMARY KEY (year, month)
+);
+
+CREATE OR REPLACE FUNCTION monthly_revenue_add(revenue_date TIMESTAMP, amount DECIMAL) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO MonthlyRevenue(year, month, revenue)
+    VALUES (EXTRACT(YEAR FROM revenue_date)::INTEGER, EXTRACT(MONTH FROM revenue_date)::INTEGER, amount)
+    ON CONFLICT (year, month) DO UPDATE SET revenue = MonthlyRevenue.revenue + EXCLUDED.revenue;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION monthly_revenue_on_order_change() RETURNS TRIGGER AS $$
+DECLARE
+    items_total DECIMAL := 0;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM monthly_revenue_add(NEW.date, NEW.delivery_fee);
+        RETURN NULL;
+    END IF;
+
+    SELECT COALESCE(SUM(dish_price * dish_amount), 0) INTO items_total
+    FROM OrderedDishes WHERE order_id = OLD.order_id;
+    PERFORM monthly_revenue_add(OLD.date, -(OLD.delivery_fee + items_total));
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM monthly_revenue_add(NEW.date, NEW.delivery_fee + items_total);
+        RETURN NULL;
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER monthly_revenue_on_order_change
+    AFTER INSERT OR UPDATE OF date, delivery_fee ON Orders
+    FOR EACH ROW EXECUTE FUNCTION monthly_revenue_on_order_change();
+
+CREATE TRIGGER monthly_revenue_on_order_delete
+    BEFORE DELETE ON Orders
+    FOR EACH ROW EXECUTE FUNCTION monthly_revenue_on_order_change();
+
+CREATE OR REPLACE FUNCTION monthly_revenue_on_item_change() RETURNS TRIGGER AS $$
+DECLARE
+    order_date TIMESTAMP;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT date INTO order_date FROM Orders WHERE order_id = OLD.order_id;
+        IF FOUND THEN
+            PERFORM monthly_revenue_add(order_date, -(OLD.dish_price * OLD.dish_amount));
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT date INTO order_date FROM Orders WHERE order_id = NEW.order_id;
+        IF FOUND THEN
+            PERFORM monthly_revenue_add(order_date, NEW.dish_price * NEW.dish_amount);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER monthly_revenue_on_item_change
+    AFTER INSERT OR UPDATE OR DELETE ON OrderedDishes
+    FOR EACH ROW EXECUTE FUNCTION monthly_revenue_on_item_change();
+'''
+
+# connected components of the "similar customers" relation (two customers rating the same dish >= 4, closed
+# transitively), kept as a union-find over customers and dishes: a high rating (c, d) merges the component of c
+# with the component of d, relabelling the smaller one. deleting a high rating may split a component, so the
+# affected component is rebuilt from its members, once per statement
+CREATE_SIMILARITY_TABLES_QUERY = '''
+CREATE TABLE SimilarityComponents
+(
+    component_id    INTEGER     GENERATED ALWAYS AS IDENTITY,
+    size            INTEGER     NOT NULL,
+    PRIMARY KEY (component_id)
+);
+
+CREATE TABLE CustomerSimilarity
+(
+    cust_id         INTEGER     NOT NULL,
+    component_id    INTEGER     NOT NULL,
+    PRIMARY KEY (cust_id),
+    FOREIGN KEY (cust_id) REFERENCES Customer(cust_id) ON DELETE CASCADE
+);
+
+CREATE TABLE DishSimilarity
+(
+    dish_id         INTEGER     NOT NULL,
+    component_id    INTEGER     NOT NULL,
+    PRIMARY KEY (dish_id),
+    FOREIGN KEY (dish_id) REFERENCES Dish(dish_id) ON DELETE CASCADE
+);
+
+CREATE INDEX customer_similarity_component_idx ON CustomerSimilarity (component_id);
+CREATE INDEX dish_similarity_component_idx ON DishSimilarity (component_id);
+
+CREATE OR REPLACE FUNCTION similarity_union(rated_cust_id INTEGER, rated_dish_id INTEGER) RETURNS VOID AS $$
+DECLARE
+    customer_component INTEGER;
+    dish_component INTEGER;
+    customer_size INTEGER;
+    dish_size INTEGER;
+BEGIN
+    SELECT component_id INTO customer_component FROM CustomerSimilarity WHERE cust_id = rated_cust_id;
+    IF customer_component IS NULL THEN
+        INSERT INTO SimilarityComponents(size) VALUES (1) RETURNING component_id INTO customer_component;
+        INSERT INTO CustomerSimilarity(cust_id, component_id) VALUES (rated_cust_id, customer_component);
+    END IF;
+
+    SELECT component_id INTO dish_component FROM DishSimilarity WHERE dish_id = rated_dish_id;
+    IF dish_component IS NULL THEN
+        INSERT INTO DishSimilarity(dish_id, component_id) VALUES (rated_dish_id, customer_component);
+        UPDATE SimilarityComponents SET size = size + 1 WHERE component_id = customer_component;
+        RETURN;
+    END IF;
+    IF dish_component = customer_component THEN
+        RETURN;
+    END IF;
+
+    -- relabel the smaller component into the larger one
+    SELECT size INTO customer_size FROM SimilarityComponents WHERE component_id = customer_component;
+    SELECT size INTO dish_size FROM SimilarityComponents WHERE component_id = dish_component;
+    IF customer_size > dish_size THEN
+        UPDATE CustomerSimilarity SET component_id = customer_component WHERE component_id = dish_component;
+        UPDATE DishSimilarity SET component_id = customer_component WHERE component_id = dish_component;
+        UPDATE SimilarityComponents SET size = customer_size + dish_size WHERE component_id = customer_component;
+        DELETE FROM SimilarityComponents WHERE component_id = dish_component;
+    ELSE
+        UPDATE CustomerSimilarity SET component_id = dish_component WHERE component_id = customer_component;
+        UPDATE DishSimilarity SET component_id = dish_component WHERE component_id = customer_component;
+        UPDATE SimilarityComponents SET size = customer_size + dish_size WHERE component_id = dish_component;
+        DELETE FROM SimilarityComponents WHERE component_id = customer_component;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- assigns a fresh component to every customer in seeds (and everything reachable from it) that has a high rating
+-- and no component yet. the component is walked breadth first over alternating dish and customer frontiers, with
+-- the similarity tables as the visited sets, so every high rating is read at most once from each side
+CREATE OR REPLACE FUNCTION similarity_build(seeds INTEGER[]) RETURNS VOID AS $$
+DECLARE
+    seed INTEGER;
+    new_component INTEGER;
+    frontier_customers INTEGER[];
+    frontier_dishes INTEGER[];
+    component_size INTEGER;
+BEGIN
+    FOREACH seed IN ARRAY seeds LOOP
+        IF NOT EXISTS (SELECT 1 FROM CustomerSimilarity WHERE cust_id = seed)
+           AND EXISTS (SELECT 1 FROM DishRatings WHERE cust_id = seed AND rating >= 4) THEN
+            INSERT INTO SimilarityComponents(size) VALUES (0) RETURNING component_id INTO new_component;
+            INSERT INTO CustomerSimilarity(cust_id, component_id) VALUES (seed, new_component);
+            frontier_customers := ARRAY[seed];
+            component_size := 1;
+
+            LOOP
+                WITH added AS (
+                    INSERT INTO DishSimilarity(dish_id, component_id)
+                    SELECT DISTINCT dish_id, new_component
+                    FROM DishRatings
+                    WHERE cust_id = ANY(frontier_customers) AND rating >= 4
+                    ON CONFLICT (dish_id) DO NOTHING
+                    RETURNING dish_id
+                )
+                SELECT array_agg(dish_id) INTO frontier_dishes FROM added;
+                EXIT WHEN frontier_dishes IS NULL;
+                component_size := component_size + cardinality(frontier_dishes);
+
+                WITH added AS (
+                    INSERT INTO CustomerSimilarity(cust_id, component_id)
+                    SELECT DISTINCT cust_id, new_component
+                    FROM DishRatings
+                    WHERE dish_id = ANY(frontier_dishes) AND rating >= 4
+                    ON CONFLICT (cust_id) DO NOTHING
+                    RETURNING cust_id
+                )
+                SELECT array_agg(cust_id) INTO frontier_customers FROM added;
+                EXIT WHEN frontier_customers IS NULL;
+                component_size := component_size + cardinality(frontier_customers);
+            END LOOP;
+
+            UPDATE SimilarityComponents SET size = component_size WHERE component_id = new_component;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION similarity_rebuild_component(rebuilt_component INTEGER) RETURNS VOID AS $$
+DECLARE
+    members INTEGER[];
+BEGIN
+    SELECT array_agg(cust_id) INTO members FROM CustomerSimilarity WHERE component_id = rebuilt_component;
+    DELETE FROM CustomerSimilarity WHERE component_id = rebuilt_component;
+    DELETE FROM DishSimilarity WHERE component_id = rebuilt_component;
+    DELETE FROM SimilarityComponents WHERE component_id = rebuilt_component;
+    IF members IS NOT NULL THEN
+        PERFORM similarity_build(members);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- concurrent maintenance is serialized per component with transaction advisory locks, keyed (1, cust_id) and
+-- (2, dish_id) for the entities and (3, component_id) for the components. a component changes its members or size
+-- only under its own lock, and an entity gets its first component only under the entity lock, so once the entities
+-- and their current components are locked nothing they read can change under the caller. components are relabelled
+-- concurrently until they are locked, hence the components are read again after every round of locks (read
+-- committed gives every statement a fresh snapshot). the later rounds may take locks out of order: a deadlock
+-- rolls back the subtransaction, which releases the locks it took, and the whole set is taken again.
+-- writers hold (0, 0) shared, rebuild_similarity() holds it exclusively
+CREATE OR REPLACE FUNCTION similarity_lock(locked_customers INTEGER[], locked_dishes INTEGER[]) RETURNS VOID AS $$
+DECLARE
+    lock_key INTEGER;
+    locked_components INTEGER[];
+    new_components INTEGER[];
+    attempt INTEGER := 1;
+BEGIN
+    PERFORM pg_advisory_xact_lock_shared(0, 0);
+    LOOP
+        BEGIN
+            FOREACH lock_key IN ARRAY ARRAY(SELECT DISTINCT unnest(locked_customers) ORDER BY 1) LOOP
+                PERFORM pg_advisory_xact_lock(1, lock_key);
+            END LOOP;
+            FOREACH lock_key IN ARRAY ARRAY(SELECT DISTINCT unnest(locked_dishes) ORDER BY 1) LOOP
+                PERFORM pg_advisory_xact_lock(2, lock_key);
+            END LOOP;
+
+            locked_components := '{}';
+            LOOP
+                SELECT array_agg(component_id ORDER BY component_id) INTO new_components
+                FROM (
+                    SELECT component_id FROM CustomerSimilarity WHERE cust_id = ANY(locked_customers)
+                    UNION
+                    SELECT component_id FROM DishSimilarity WHERE dish_id = ANY(locked_dishes)
+                ) current_components
+                WHERE component_id <> ALL(locked_components);
+                EXIT WHEN new_components IS NULL;
+                FOREACH lock_key IN ARRAY new_components LOOP
+                    PERFORM pg_advisory_xact_lock(3, lock_key);
+                END LOOP;
+                locked_components := locked_components || new_components;
+            END LOOP;
+            RETURN;
+        EXCEPTION WHEN deadlock_detected THEN
+            IF attempt >= 3 THEN
+                RAISE;
+            END IF;
+            attempt := attempt + 1;
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- the triggers run once per statement over its transition tables, so every component that lost a high rating is
+-- rebuilt once however many of its ratings the statement removed (e.g. by delete_customer), then the new high
+-- ratings are merged in. a trigger with transition tables takes a single event, hence one per event.
+-- a statement that leaves the high ratings as they were (low ratings, a rating that stays >= 4) takes no lock
+CREATE OR REPLACE FUNCTION similarity_on_ratings_change() RETURNS TRIGGER AS $$
+DECLARE
+    lost_customers INTEGER[];
+    lost_dishes INTEGER[];
+    gained_customers INTEGER[];
+    gained_dishes INTEGER[];
+    dirty_component INTEGER;
+    i INTEGER;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(cust_id), array_agg(dish_id) INTO lost_customers, lost_dishes
+        FROM old_ratings WHERE rating >= 4;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(cust_id), array_agg(dish_id) INTO lost_customers, lost_dishes
+        FROM old_ratings
+        WHERE rating >= 4
+          AND NOT EXISTS (SELECT 1 FROM new_ratings
+                          WHERE new_ratings.cust_id = old_ratings.cust_id
+                            AND new_ratings.dish_id = old_ratings.dish_id AND new_ratings.rating >= 4);
+        SELECT array_agg(cust_id ORDER BY cust_id, dish_id), array_agg(dish_id ORDER BY cust_id, dish_id)
+        INTO gained_customers, gained_dishes
+        FROM new_ratings
+        WHERE rating >= 4
+          AND NOT EXISTS (SELECT 1 FROM old_ratings
+                          WHERE old_ratings.cust_id = new_ratings.cust_id
+                            AND old_ratings.dish_id = new_ratings.dish_id AND old_ratings.rating >= 4);
+    ELSE
+        SELECT array_agg(cust_id ORDER BY cust_id, dish_id), array_agg(dish_id ORDER BY cust_id, dish_id)
+        INTO gained_customers, gained_dishes
+        FROM new_ratings WHERE rating >= 4;
+    END IF;
+    IF lost_customers IS NULL AND gained_customers IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM similarity_lock(COALESCE(lost_customers, '{}') || COALESCE(gained_customers, '{}'),
+                            COALESCE(lost_dishes, '{}') || COALESCE(gained_dishes, '{}'));
+    IF lost_dishes IS NOT NULL THEN
+        FOR dirty_component IN
+            SELECT DISTINCT component_id FROM DishSimilarity WHERE dish_id = ANY(lost_dishes)
+        LOOP
+            PERFORM similarity_rebuild_component(dirty_component);
+        END LOOP;
+    END IF;
+    IF gained_customers IS NOT NULL THEN
+        FOR i IN 1 .. cardinality(gained_customers) LOOP
+            PERFORM similarity_union(gained_customers[i], gained_dishes[i]);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER similarity_on_ratings_insert
+    AFTER INSERT ON DishRatings REFERENCING NEW TABLE AS new_ratings
+    FOR EACH STATEMENT EXECUTE FUNCTION similarity_on_ratings_change();
+
+CREATE TRIGGER similarity_on_ratings_update
+    AFTER UPDATE ON DishRatings REFERENCING OLD TABLE AS old_ratings NEW TABLE AS new_ratings
+    FOR EACH STATEMENT EXECUTE FUNCTION similarity_on_ratings_change();
+
+CREATE TRIGGER similarity_on_ratings_delete
+    AFTER DELETE ON DishRatings REFERENCING OLD TABLE AS old_ratings
+    FOR EACH STATEMENT EXECUTE FUNCTION similarity_on_ratings_change();
+'''
+
+REBUILD_SIMILARITY_QUERY = '''
+    SELECT pg_advisory_xact_lock(0, 0);
+    DELETE FROM CustomerSimilarity;
+    DELETE FROM DishSimilarity;
+    DELETE FROM SimilarityComponents;
+    SELECT similarity_build(ARRAY(SELECT DISTINCT cust_id FROM DishRatings WHERE rating >= 4));
+'''
+
+# every committed change of a Dish, Customer or DishRatings row is broadcast on CACHE_INVALIDATION_CHANNEL as
+# '<table>:<key>' so that the caches of other processes can drop it (see start_cache_invalidation_listener),
+# changes of OrderedDishes and Placed as '<table>:'
+CACHE_INVALIDATION_CHANNEL = 'cache_invalidation'
+
+CREATE_CACHE_INVALIDATION_TRIGGERS_QUERY = f'''
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS TRIGGER AS $$
+BEGIN
+    -- TG_ARGV[0] is the table name sent in the payload, TG_ARGV[1] the key column
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('{CACHE_INVALIDATION_CHANNEL}', TG_ARGV[0] || ':' || (to_jsonb(OLD) ->> TG_ARGV[1]));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('{CACHE_INVALIDATION_CHANNEL}', TG_ARGV[0] || ':' || (to_jsonb(NEW) ->> TG_ARGV[1]));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON Dish
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('Dish', 'dish_id');
+
+CREATE TRIGGER customer_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON Customer
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('Customer', 'cust_id');
+
+CREATE TRIGGER dish_ratings_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON DishRatings
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('DishRatings', 'dish_id');
+
+-- only whole results depend on these tables, one notification per statement is enough
+CREATE OR REPLACE FUNCTION notify_table_invalidation() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('{CACHE_INVALIDATION_CHANNEL}', TG_ARGV[0] || ':');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ordered_dishes_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON OrderedDishes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_invalidation('OrderedDishes');
+
+CREATE TRIGGER placed_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON Placed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_invalidation('Placed');
+'''
+
+# orders whose maintained total differs from the live aggregate over OrderedDishes
+CHECK_ORDER_TOTALS_QUERY = '''
+    SELECT Orders.order_id AS order_id, OrderTotals.total AS maintained, COALESCE(live.total, 0) AS live
+    FROM Orders
+        LEFT JOIN OrderTotals ON Orders.order_id = OrderTotals.order_id
+        LEFT JOIN (
+            SELECT order_id, SUM(dish_price * dish_amount) AS total
+            FROM OrderedDishes
+            GROUP BY order_id
+        ) live ON Orders.order_id = live.order_id
+    WHERE OrderTotals.total IS DISTINCT FROM COALESCE(live.total, 0)
+    ORDER BY Orders.order_id ASC
+'''
+
+# dishes whose maintained rating sum or count differs from the live aggregate over DishRatings
+CHECK_DISH_RATING_STATS_QUERY = '''
+    SELECT Dish.dish_id AS dish_id
+    FROM Dish
+        LEFT JOIN DishRatingStats ON Dish.dish_id = DishRatingStats.dish_id
+        LEFT JOIN (
+            SELECT dish_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count
+            FROM DishRatings
+            GROUP BY dish_id
+        ) live ON Dish.dish_id = live.dish_id
+    WHERE DishRatingStats.rating_sum IS DISTINCT FROM COALESCE(live.rating_sum, 0)
+       OR DishRatingStats.rating_count IS DISTINCT FROM COALESCE(live.rating_count, 0)
+    ORDER BY Dish.dish_id ASC
+'''
+
+REBUILD_ORDER_TOTALS_QUERY = '''
+    DELETE FROM OrderTotals;
+    INSERT INTO OrderTotals(order_id, total)
+        SELECT Orders.order_id, COALESCE(SUM(OrderedDishes.dish_price * OrderedDishes.dish_amount), 0)
+        FROM Orders LEFT OUTER JOIN OrderedDishes ON Orders.order_id = OrderedDishes.order_id
+        GROUP BY Orders.order_id;
+'''
+
+REBUILD_MONTHLY_REVENUE_QUERY = '''
+    DELETE FROM MonthlyRevenue;
+    INSERT INTO MonthlyRevenue(year, month, revenue)
+        SELECT EXTRACT(YEAR FROM Orders.date)::INTEGER, EXTRACT(MONTH FROM Orders.date)::INTEGER,
+               SUM(OrdersSum.total + OrdersSum.delivery_fee)
+        FROM Orders JOIN OrdersSum ON Orders.order_id = OrdersSum.order_id
+        GROUP BY 1, 2;
+'''
+
+REBUILD_DISH_PRICE_STATS_QUERY = '''
+    DELETE FROM DishPriceStats;
+    INSERT INTO DishPriceStats(dish_id, dish_price, amount_sum, line_count)
+        SELECT dish_id, dish_price, SUM(dish_amount), COUNT(*)
+        FROM OrderedDishes
+        GROUP BY dish_id, dish_price;
+'''
+
 # ------------------------------- Database Views Definitions -------------------------------
+# OrdersSum reads the per-order totals maintained by the triggers below instead of aggregating OrderedDishes
 CREATE_VIEW_ORDERSSUM = '''
 CREATE VIEW OrdersSum AS
 (
     SELECT Orders.order_id AS order_id,
-           COALESCE(SUM(OrderedDishes.dish_price * OrderedDishes.dish_amount),0) AS total,
-            MAX(Orders.delivery_fee) AS delivery_fee
-    FROM Orders LEFT OUTER JOIN OrderedDishes
-        ON Orders.order_id = OrderedDishes.order_id
-    GROUP BY Orders.order_id
-);   
+           OrderTotals.total AS total,
+           Orders.delivery_fee AS delivery_fee
+    FROM Orders JOIN OrderTotals
+        ON Orders.order_id = OrderTotals.order_id
+);
 '''
 
 CREATE_VIEW_CUSTOMESRORDERS = '''
@@ -121,22 +721,22 @@ CREATE VIEW CustomersOrders AS
 '''
 
 
+# RatingScore reads the per-dish averages maintained in DishRatingStats
 CREATE_VIEW_RATINGSCORE = '''
 CREATE VIEW RatingScore AS
 (
-    SELECT Dish.dish_id AS dish_id, COALESCE(AVG(DishRatings.rating), 3) AS avg_rating
-    FROM Dish LEFT OUTER JOIN DishRatings ON (Dish.dish_id = DishRatings.dish_id)
-    GROUP BY Dish.dish_id
+    SELECT dish_id, avg_rating
+    FROM DishRatingStats
 );       
 '''
 
 
+# appo reads the per-(dish, price) amounts maintained in DishPriceStats, val is AVG(dish_amount)*dish_price
 CREATE_VIEW_APPO= '''
 CREATE VIEW appo AS
 (
-    SELECT dish_id , dish_price , COALESCE(AVG(dish_amount), 0)*dish_price AS val 
-    FROM OrderedDishes
-    GROUP BY dish_id , dish_price
+    SELECT dish_id , dish_price , (amount_sum::DECIMAL / line_count)*dish_price AS val
+    FROM DishPriceStats
 );
 '''
 CREATE_VIEW_ORDERED_DISHES_BY_CUSTOMER = '''
@@ -157,8 +757,182 @@ CREATE VIEW SimilarRelation AS
 );
 '''
 
-All_TABLE_NAMES = ['DishRatings', 'OrderedDishes', 'Placed', 'Orders', 'Dish', 'Customer']
+# ------------------------------- Prepared CRUD Statements -------------------------------
+# every CRUD statement is PREPAREd once per pooled connection and EXECUTEd with bound parameters
+CRUD_STATEMENTS = {
+    'add_customer': '''
+        INSERT INTO Customer(cust_id, full_name, age, phone)
+        VALUES($1, $2, $3, $4)
+    ''',
+    'get_customer': '''
+        SELECT * FROM Customer WHERE cust_id = $1
+    ''',
+    'delete_customer': '''
+        DELETE FROM Customer WHERE cust_id = $1
+    ''',
+    'add_order': '''
+        INSERT INTO Orders(order_id, date, delivery_fee, delivery_address)
+        VALUES($1, $2, $3, $4)
+    ''',
+    'get_order': '''
+        SELECT * FROM Orders WHERE order_id = $1
+    ''',
+    'delete_order': '''
+        DELETE FROM Orders WHERE order_id = $1
+    ''',
+    'add_dish': '''
+        INSERT INTO Dish(dish_id, name, price, is_active)
+        VALUES($1, $2, $3, $4)
+    ''',
+    'get_dish': '''
+        SELECT * FROM Dish WHERE dish_id = $1
+    ''',
+    'update_dish_price': '''
+        UPDATE Dish SET price = $2 WHERE (dish_id = $1 AND is_active = TRUE)
+    ''',
+    'update_dish_active_status': '''
+        UPDATE Dish SET is_active = $2 WHERE dish_id = $1
+    ''',
+    'customer_placed_order': '''
+        INSERT INTO Placed(cust_id, order_id)
+        VALUES($1, $2)
+    ''',
+    'get_customer_that_placed_order': '''
+        SELECT * FROM Customer WHERE cust_id = (SELECT cust_id FROM Placed WHERE order_id = $1)
+    ''',
+    'order_contains_dish': '''
+        INSERT INTO OrderedDishes(order_id, dish_id, dish_amount, dish_price)
+        VALUES($1, $2, $3,
+            (SELECT price FROM Dish WHERE (dish_id = $2 AND is_active = TRUE))
+        )
+    ''',
+    'order_does_not_contain_dish': '''
+        DELETE FROM OrderedDishes WHERE (order_id = $1 AND dish_id = $2)
+    ''',
+    'get_all_order_items': '''
+        SELECT * FROM OrderedDishes
+        WHERE order_id = $1
+        ORDER BY dish_id ASC
+    ''',
+    'customer_rated_dish': '''
+        INSERT INTO DishRatings(cust_id, dish_id, rating)
+        VALUES($1, $2, $3)
+    ''',
+    'customer_deleted_rating_on_dish': '''
+        DELETE FROM DishRatings WHERE (cust_id = $1 AND dish_id = $2)
+    ''',
+    'get_all_customer_ratings': '''
+        SELECT * FROM DishRatings WHERE cust_id = $1 ORDER BY dish_id ASC
+    ''',
+    'get_customers': '''
+        SELECT * FROM Customer WHERE cust_id = ANY($1)
+    ''',
+    'get_orders': '''
+        SELECT * FROM Orders WHERE order_id = ANY($1)
+    ''',
+    'get_dishes': '''
+        SELECT * FROM Dish WHERE dish_id = ANY($1)
+    ''',
+    'get_customers_that_placed_orders': '''
+        SELECT Placed.order_id AS placed_order_id, Customer.*
+        FROM Placed JOIN Customer ON Customer.cust_id = Placed.cust_id
+        WHERE Placed.order_id = ANY($1)
+    ''',
+}
+
+# multi-row inserts used by the bulk API, a batch with any bad or duplicate row fails as a whole
+BULK_INSERT_PAGE_SIZE = 1000
+
+BULK_ADD_CUSTOMERS_QUERY = '''
+    INSERT INTO Customer(cust_id, full_name, age, phone)
+    VALUES %s
+    RETURNING cust_id
+'''
+
+BULK_ADD_ORDERS_QUERY = '''
+    INSERT INTO Orders(order_id, date, delivery_fee, delivery_address)
+    VALUES %s
+    RETURNING order_id
+'''
+
+BULK_ADD_DISHES_QUERY = '''
+    INSERT INTO Dish(dish_id, name, price, is_active)
+    VALUES %s
+    RETURNING dish_id
+'''
+
+# streaming ingest of order line items (see ingest_order_items)
+ORDER_ITEMS_INGEST_CHUNK_SIZE = 5000
+
+INGEST_ACTIVE_DISH_PRICES_QUERY = '''
+    SELECT dish_id, price FROM Dish WHERE is_active = TRUE AND dish_id = ANY(%s)
+'''
+
+INGEST_EXISTING_ORDERS_QUERY = '''
+    SELECT order_id FROM Orders WHERE order_id = ANY(%s)
+'''
+
+INGEST_EXISTING_ORDER_ITEMS_QUERY = '''
+    SELECT order_id, dish_id FROM OrderedDishes WHERE order_id = ANY(%s)
+'''
+
+# place_order: the order, its customer and every line item in one statement. %(dish_ids)s / %(amounts)s are
+# the parallel arrays of the basket, a line is written when its dish is active and its amount positive, the
+# first such line of every dish wins. returns the line numbers (1 based) of the lines of an active dish
+PLACE_ORDER_QUERY = '''
+    WITH new_order AS (
+        INSERT INTO Orders(order_id, date, delivery_fee, delivery_address)
+        VALUES(%(order_id)s, %(date)s, %(delivery_fee)s, %(delivery_address)s)
+        RETURNING order_id
+    ), placed AS (
+        INSERT INTO Placed(order_id, cust_id)
+        SELECT order_id, %(cust_id)s FROM new_order WHERE %(cust_id)s IS NOT NULL
+    ), priced AS (
+        SELECT items.line, items.dish_id, items.amount, Dish.price
+        FROM unnest(%(dish_ids)s::INTEGER[], %(amounts)s::INTEGER[]) WITH ORDINALITY AS items(dish_id, amount, line)
+            JOIN Dish ON Dish.dish_id = items.dish_id AND Dish.is_active = TRUE
+    ), lines AS (
+        INSERT INTO OrderedDishes(order_id, dish_id, dish_amount, dish_price)
+        SELECT DISTINCT ON (priced.dish_id) new_order.order_id, priced.dish_id, priced.amount, priced.price
+        FROM new_order, priced
+        WHERE priced.amount > 0
+        ORDER BY priced.dish_id, priced.line
+    )
+    SELECT line FROM priced
+'''
+
+for statement_name, statement_query in CRUD_STATEMENTS.items():
+    Connector.register_statement(statement_name, statement_query)
+
+# ------------------------------- Secondary Indexes -------------------------------
+# foreign key / lookup columns of the views and analytical queries, primary keys are indexed already
+CREATE_INDEXES_QUERY = '''
+-- the orders of one customer: did_customer_order_top_rated_dishes, customer_ordered_any_dish,
+-- get_potential_dish_recommendations (CustomerOrderedDishes) and the NOT EXISTS of get_customers_rated_but_not_ordered
+CREATE INDEX placed_cust_id_idx ON Placed (cust_id);
+-- the line items of a few dishes: customer_ordered_any_dish, query_top_rated_dishes_bitmap (the top 5 dishes)
+-- and the NOT EXISTS of get_customers_rated_but_not_ordered
+CREATE INDEX ordered_dishes_dish_id_idx ON OrderedDishes (dish_id);
+-- get_customers_rated_but_not_ordered reads the low ratings of the 5 lowest rated dishes
+CREATE INDEX dish_ratings_dish_id_idx ON DishRatings (dish_id, rating);
+-- similarity_build expands its dish frontier to the customers who rated those dishes >= 4,
+-- its customer frontier is read through the DishRatings primary key (cust_id, dish_id)
+CREATE INDEX dish_ratings_high_idx ON DishRatings (dish_id, cust_id) WHERE rating >= 4;
+-- get_cumulative_profit scans the orders of a date range when it can not use MonthlyRevenue
+CREATE INDEX orders_date_idx ON Orders (date);
+'''
+
+All_TABLE_NAMES = ['DishRatings', 'CustomerSimilarity', 'DishSimilarity', 'SimilarityComponents', 'OrderedDishes',
+                   'Placed', 'OrderTotals', 'Orders', 'MonthlyRevenue', 'DishRatingStats', 'DishPriceStats', 'DishPriceHistory', 'Dish',
+                   'Customer']
 ALL_VIEW_NAMES = ['OrdersSum', 'CustomersOrders', 'RatingScore', 'appo', 'CustomerOrderedDishes', 'SimilarRelation']
+ALL_FUNCTION_NAMES = ['order_totals_on_order_insert', 'order_totals_on_item_change',
+                      'dish_rating_stats_on_dish_insert', 'dish_rating_stats_on_rating_change',
+                      'similarity_on_ratings_change', 'similarity_lock', 'similarity_rebuild_component',
+                      'similarity_build', 'similarity_union',
+                      'notify_cache_invalidation', 'notify_table_invalidation',
+                      'dish_price_history_on_price_change', 'dish_price_stats_on_item_change',
+                      'monthly_revenue_on_order_change', 'monthly_revenue_on_item_change', 'monthly_revenue_add']
 
 
 # ------------------------------- Function helper: -------------------------------
@@ -188,25 +962,228 @@ def handle_database_exceptions(query: sql.SQL, e: Exception, print_flag = False)
     return result
 
 
-def handle_query(query: sql.SQL) -> Tuple[ReturnValue, int, Connector.ResultSet, Exception]:
+# the connection pinned by Solution.transaction() for the current thread, if any
+_transaction_state = threading.local()
+
+
+# with Solution.transaction():
+#     add_order(...), customer_placed_order(...), order_contains_dish(...), ...
+# every API call inside the block runs on the same connection and the block is committed once at its end.
+# each call runs inside its own savepoint, so a failing call still returns its ReturnValue and only its own
+# changes are undone. an exception escaping the block rolls back everything, nested blocks join the outer one
+@contextmanager
+def transaction():
+    if getattr(_transaction_state, 'conn', None) is not None:
+        yield
+        return
+
+    pool = Connector.get_pool()
+    conn = pool.acquire()
+    _transaction_state.conn = conn
+    _transaction_state.invalidations = []
+    try:
+        with conn.transaction():
+            yield
+    finally:
+        _transaction_state.conn = None
+        pool.release(conn)
+        # entries read by other threads while the transaction was open may be stale now that it ended
+        for cache, key in _transaction_state.invalidations:
+            cache.invalidate(key)
+        _transaction_state.invalidations = []
+
+
+def in_transaction() -> bool:
+    return getattr(_transaction_state, 'conn', None) is not None
+
+
+def execute_on_pooled_connection(query_description, action) -> Tuple[ReturnValue, int, Connector.ResultSet, Exception]:
     query_result = ReturnValue.OK
     rows_amount = 0
     result = None
     recieved_exp = None
-    conn = Connector.DBConnector()
+
+    conn = getattr(_transaction_state, 'conn', None)
+    if conn is not None:
+        # inside Solution.transaction(): no commit here, a failure only undoes this call
+        try:
+            with conn.savepoint():
+                rows_amount, result = action(conn)
+        except Exception as e:
+            recieved_exp = e
+            query_result = handle_database_exceptions(query_description, e, DEBUG_FLAG)
+        return query_result, rows_amount, result, recieved_exp
+
+    pool = Connector.get_pool()
+    conn = pool.acquire()
 
     try:
-        rows_amount, result = conn.execute(query)
+        rows_amount, result = action(conn)
         conn.commit()
     except Exception as e:
         recieved_exp = e
-        query_result = handle_database_exceptions(query, e, DEBUG_FLAG)
+        query_result = handle_database_exceptions(query_description, e, DEBUG_FLAG)
     finally:
-        conn.close()
+        # the pool rolls back anything left uncommitted before handing the connection out again
+        pool.release(conn)
 
     return query_result, rows_amount, result, recieved_exp
 
 
+def handle_query(query: sql.SQL) -> Tuple[ReturnValue, int, Connector.ResultSet, Exception]:
+    return execute_on_pooled_connection(query, lambda conn: conn.execute(query))
+
+
+# runs one of the CRUD_STATEMENTS with bound parameters
+def handle_prepared_query(statement_name: str, params: tuple) -> Tuple[ReturnValue, int, Connector.ResultSet, Exception]:
+    return execute_on_pooled_connection(f'EXECUTE {statement_name}{params}',
+                                        lambda conn: conn.execute_prepared(statement_name, params))
+
+
+# yields the rows of a SELECT lazily through a server side cursor, the pooled connection is held until the
+# generator is exhausted or closed (inside Solution.transaction() the pinned connection is used)
+def stream_query(query: sql.SQL, itersize: int = Connector.STREAM_ITERSIZE) -> Iterator[Connector.ResultSetRow]:
+    conn = getattr(_transaction_state, 'conn', None)
+    if conn is not None:
+        yield from conn.execute_stream(query, itersize=itersize)
+        return
+
+    pool = Connector.get_pool()
+    conn = pool.acquire()
+    try:
+        yield from conn.execute_stream(query, itersize=itersize)
+    finally:
+        pool.release(conn)
+
+
+# ------------------------------- Read-through caches: -------------------------------
+# get_customer and get_dish are served from in-process LRU caches, entries are dropped by every function
+# writing the cached row. values read inside Solution.transaction() are neither served from nor stored in the cache
+CUSTOMER_CACHE_SIZE = 4096
+CUSTOMER_CACHE_TTL = 300.0
+DISH_CACHE_SIZE = 1024
+DISH_CACHE_TTL = 300.0
+
+# whole results of analytical functions, keyed by function name: a cached result is dropped when one of the
+# tables its query reads is written. it is opt-in (size 0) because a single write anywhere in those tables stales a
+# whole result, and writes of other processes only reach this one through start_cache_invalidation_listener:
+# enable it with configure_caches(result_size=...) in a single process, or together with the listener
+RESULT_CACHE_SIZE = 0
+RESULT_CACHE_TTL = 300.0
+
+CUSTOMER_CACHE = Cache.LRUCache(CUSTOMER_CACHE_SIZE, CUSTOMER_CACHE_TTL)
+DISH_CACHE = Cache.LRUCache(DISH_CACHE_SIZE, DISH_CACHE_TTL)
+RESULT_CACHE = Cache.LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+# cached result -> the tables it depends on. for 'Dish' only inserts matter (a new dish enters RatingScore)
+RESULT_CACHE_DEPENDENCIES = {
+    'get_customers_rated_but_not_ordered': ('Dish', 'DishRatings', 'OrderedDishes', 'Placed'),
+    'top_rated_dishes': ('Dish', 'DishRatings'),
+    'top_rated_dishes_bitmap': ('Dish', 'DishRatings', 'OrderedDishes', 'Placed'),
+}
+
+
+def configure_caches(customer_size: int = CUSTOMER_CACHE_SIZE, customer_ttl: float = CUSTOMER_CACHE_TTL,
+                     dish_size: int = DISH_CACHE_SIZE, dish_ttl: float = DISH_CACHE_TTL,
+                     result_size: int = RESULT_CACHE_SIZE, result_ttl: float = RESULT_CACHE_TTL) -> None:
+    CUSTOMER_CACHE.resize(customer_size, customer_ttl)
+    DISH_CACHE.resize(dish_size, dish_ttl)
+    RESULT_CACHE.resize(result_size, result_ttl)
+
+
+def cache_stats() -> dict:
+    return {'customer': CUSTOMER_CACHE.stats(), 'dish': DISH_CACHE.stats(), 'result': RESULT_CACHE.stats()}
+
+
+def invalidate_cached(cache: Cache.LRUCache, key) -> None:
+    cache.invalidate(key)
+    if in_transaction():
+        _transaction_state.invalidations.append((cache, key))
+
+
+# called by every function writing one of the tables, after the write
+def invalidate_results(*tables: str) -> None:
+    for name, dependencies in RESULT_CACHE_DEPENDENCIES.items():
+        if any(table in dependencies for table in tables):
+            invalidate_cached(RESULT_CACHE, name)
+
+
+def result_cache_enabled() -> bool:
+    return RESULT_CACHE.max_size > 0 and not in_transaction()
+
+
+# the cached result of fn() (see RESULT_CACHE), computed and stored on a miss.
+# the returned object is the cached one, callers must not modify it
+def cached_result(name: str, fn: Callable):
+    use_cache = not in_transaction()
+    if use_cache:
+        cached = RESULT_CACHE.get(name)
+        if cached is not Cache.MISSING:
+            return cached
+        token = RESULT_CACHE.token()
+
+    result = fn()
+    if use_cache and result is not None:
+        RESULT_CACHE.put(name, result, token)
+    return result
+
+
+def clear_caches() -> None:
+    CUSTOMER_CACHE.clear()
+    DISH_CACHE.clear()
+    RESULT_CACHE.clear()
+
+
+def invalidate_dish_notification(key: str) -> None:
+    DISH_CACHE.invalidate(int(key))
+    invalidate_results('Dish')
+
+
+def invalidate_customer_notification(key: str) -> None:
+    CUSTOMER_CACHE.invalidate(int(key))
+
+
+# cross-process invalidation: table name in the notification payload -> function dropping the cached key
+INVALIDATION_HANDLERS = {
+    'Dish': invalidate_dish_notification,
+    'Customer': invalidate_customer_notification,
+    'DishRatings': lambda key: invalidate_results('DishRatings'),
+    'OrderedDishes': lambda key: invalidate_results('OrderedDishes'),
+    'Placed': lambda key: invalidate_results('Placed'),
+}
+
+_invalidation_listener = None
+
+
+def handle_invalidation_notification(payload: str) -> None:
+    table, _, key = payload.partition(':')
+    handler = INVALIDATION_HANDLERS.get(table)
+    if handler is not None:
+        handler(key)
+
+
+# start a background listener applying the invalidations committed by other processes to the local caches.
+# the caches are emptied whenever the listener (re)connects, since notifications may have been missed
+def start_cache_invalidation_listener() -> None:
+    global _invalidation_listener
+    if _invalidation_listener is None:
+        _invalidation_listener = Connector.NotificationListener(CACHE_INVALIDATION_CHANNEL,
+                                                                handle_invalidation_notification,
+                                                                on_connect=clear_caches)
+    _invalidation_listener.start()
+
+
+def stop_cache_invalidation_listener() -> None:
+    if _invalidation_listener is not None:
+        _invalidation_listener.stop()
+
+
+def cache_invalidation_stats() -> dict:
+    if _invalidation_listener is None:
+        return {}
+    return _invalidation_listener.stats()
+
+
 def return_Value_select(qstatus:ReturnValue, rows_effected)-> ReturnValue:
         if qstatus == ReturnValue.OK and rows_effected == 0:
             return ReturnValue.NOT_EXISTS
@@ -224,6 +1201,13 @@ def create_tables() -> None:
             CREATE_PLACED_TABLE_QUERY + \
             CREATE_ORDERED_DISHES_TABLE_QUERY  + \
             CREATE_DISH_RATINGS_TABLE_QUERY + \
+            CREATE_INDEXES_QUERY + \
+            CREATE_ORDER_TOTALS_TABLE_QUERY + \
+            CREATE_DISH_RATING_STATS_TABLE_QUERY + \
+            CREATE_DISH_PRICE_TABLES_QUERY + \
+            CREATE_MONTHLY_REVENUE_TABLE_QUERY + \
+            CREATE_SIMILARITY_TABLES_QUERY + \
+            CREATE_CACHE_INVALIDATION_TRIGGERS_QUERY + \
             CREATE_VIEW_ORDERSSUM + \
             CREATE_VIEW_CUSTOMESRORDERS + \
             CREATE_VIEW_RATINGSCORE + \
@@ -239,81 +1223,116 @@ def clear_tables() -> None:
     CLEAR_TABLES_QUERY_FORMAT = '\n'.join([f"DELETE FROM {table};" for table in All_TABLE_NAMES])
     query = sql.SQL(CLEAR_TABLES_QUERY_FORMAT)
     handle_query(query)
+    clear_caches()
 
 
 def drop_tables() -> None:
     DROP_TABLES_AND_VIEWS_QUERY_FORMAT = '\n'.join([f"DROP VIEW IF EXISTS {table};" for table in ALL_VIEW_NAMES])
     DROP_TABLES_AND_VIEWS_QUERY_FORMAT += '\n'.join([f"DROP TABLE IF EXISTS {table} CASCADE;" for table in All_TABLE_NAMES])
+    DROP_TABLES_AND_VIEWS_QUERY_FORMAT += '\n'.join([f"DROP FUNCTION IF EXISTS {function} CASCADE;" for function in ALL_FUNCTION_NAMES])
     query = sql.SQL(DROP_TABLES_AND_VIEWS_QUERY_FORMAT)
     handle_query(query)
+    clear_caches()
+
+
+# the order ids whose maintained OrdersSum total disagrees with the live aggregate (empty when consistent)
+def check_orders_sum_consistency() -> List[int]:
+    query = sql.SQL(CHECK_ORDER_TOTALS_QUERY)
+    _, _, data, _ = handle_query(query)
+    if data is None:
+        return []
+    return [row['order_id'] for row in data]
+
+
+# the dish ids whose maintained DishRatingStats disagree with the live aggregate (empty when consistent)
+def check_rating_score_consistency() -> List[int]:
+    query = sql.SQL(CHECK_DISH_RATING_STATS_QUERY)
+    _, _, data, _ = handle_query(query)
+    if data is None:
+        return []
+    return [row['dish_id'] for row in data]
+
+
+# recompute the similar customers components from DishRatings
+def rebuild_similarity() -> ReturnValue:
+    query = sql.SQL(REBUILD_SIMILARITY_QUERY)
+    qstatus, _, _, _ = handle_query(query)
+    return qstatus
+
+
+# recompute every maintained order total from OrderedDishes
+def rebuild_orders_sum() -> ReturnValue:
+    query = sql.SQL(REBUILD_ORDER_TOTALS_QUERY)
+    qstatus, _, _, _ = handle_query(query)
+    return qstatus
+
+
+# recompute the revenue of every month from Orders and OrdersSum
+def rebuild_monthly_revenue() -> ReturnValue:
+    query = sql.SQL(REBUILD_MONTHLY_REVENUE_QUERY)
+    qstatus, _, _, _ = handle_query(query)
+    return qstatus
+
+
+# recompute the per-(dish, price) ordered amounts from OrderedDishes
+def rebuild_dish_price_stats() -> ReturnValue:
+    query = sql.SQL(REBUILD_DISH_PRICE_STATS_QUERY)
+    qstatus, _, _, _ = handle_query(query)
+    return qstatus
+
     
 
 
 # CRUD API
 
 def add_customer(customer: Customer) -> ReturnValue:
-    ADD_CUSTOMER_QUERY_FORMAT = '''
-        INSERT INTO Customer(cust_id,full_name,age,phone)
-        VALUES({cust_id}, {full_name}, {age}, {phone})
-    '''  
-    query = sql.SQL(ADD_CUSTOMER_QUERY_FORMAT).format(
-        cust_id = sql.Literal(customer.get_cust_id()),
-        full_name = sql.Literal(customer.get_full_name()),
-        age = sql.Literal(customer.get_age()),
-        phone = sql.Literal(customer.get_phone())
-    )
-
-    q_status, _, _, _ = handle_query(query)
+    params = (customer.get_cust_id(), customer.get_full_name(), customer.get_age(), customer.get_phone())
+    q_status, _, _, _ = handle_prepared_query('add_customer', params)
     return q_status
 
 
 
 def get_customer(customer_id: int) -> Customer:
-    GET_CUSTOMER_QUERY_FORMAT = f'''
-        SELECT * FROM Customer WHERE cust_id={customer_id}
-    '''
-    query = sql.SQL(GET_CUSTOMER_QUERY_FORMAT)
-    qstatus, rows_effected, rows, _ = handle_query(query)
+    use_cache = not in_transaction()
+    if use_cache:
+        cached = CUSTOMER_CACHE.get(customer_id)
+        if cached is not Cache.MISSING:
+            return Customer(*cached)
+        token = CUSTOMER_CACHE.token()
+
+    qstatus, rows_effected, rows, _ = handle_prepared_query('get_customer', (customer_id,))
     qstatus = return_Value_select(qstatus,rows_effected)
    
     if qstatus != ReturnValue.OK:
         retObject = BadCustomer()
     else:
-        retObject = Customer(rows[0]['cust_id'], rows[0]['full_name'], rows[0]['age'], rows[0]['phone'])
+        fields = (rows[0]['cust_id'], rows[0]['full_name'], rows[0]['age'], rows[0]['phone'])
+        if use_cache:
+            CUSTOMER_CACHE.put(customer_id, fields, token)
+        retObject = Customer(*fields)
     return retObject
 
 
 def delete_customer(customer_id: int) -> ReturnValue:
-    DELETE_CUSTOMER_QUERY_FORMAT = f'''
-        DELETE FROM Customer WHERE cust_id={customer_id}
-    '''
-    query = sql.SQL(DELETE_CUSTOMER_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('delete_customer', (customer_id,))
+    invalidate_cached(CUSTOMER_CACHE, customer_id)
+    invalidate_results('Placed', 'DishRatings')
     return return_Value_select(qstatus, rows_effected)
 
 
-def add_order(order: Order) -> ReturnValue:
+def add_order_params(order: Order) -> tuple:
     # TODO- order.get_datetime() should be in secend ?
-    ADD_ORDER_QUERY_FORMAT = '''
-        INSERT INTO Orders(order_id, date, delivery_fee, delivery_address)
-        VALUES({order_id}, {date}, {delivery_fee}, {delivery_address})
-    '''
-    query = sql.SQL(ADD_ORDER_QUERY_FORMAT).format(
-        order_id = sql.Literal(order.get_order_id()),
-        date = sql.Literal(order.get_datetime().strftime("%Y-%m-%d %H:%M:%S")),
-        delivery_fee = sql.Literal(order.get_delivery_fee()),
-        delivery_address = sql.Literal(order.get_delivery_address())
-    )
-    q_status, _, _, _ = handle_query(query)
+    return (order.get_order_id(), order.get_datetime().strftime("%Y-%m-%d %H:%M:%S"),
+            order.get_delivery_fee(), order.get_delivery_address())
+
+
+def add_order(order: Order) -> ReturnValue:
+    q_status, _, _, _ = handle_prepared_query('add_order', add_order_params(order))
     return q_status
 
 
 def get_order(order_id: int) -> Order:
-    GET_ORDER_QUERY_FORMAT = f'''
-        SELECT * FROM Orders WHERE order_id={order_id}
-    '''
-    query = sql.SQL(GET_ORDER_QUERY_FORMAT)
-    qstatus, rows_effected, rows, _ = handle_query(query)
+    qstatus, rows_effected, rows, _ = handle_prepared_query('get_order', (order_id,))
     qstatus = return_Value_select(qstatus, rows_effected)
     if qstatus != ReturnValue.OK:
         retObject = BadOrder()
@@ -324,115 +1343,98 @@ def get_order(order_id: int) -> Order:
 
 
 def delete_order(order_id: int) -> ReturnValue:
-    DELETE_ORDER_QUERY_FORMAT = f'''
-    DELETE FROM Orders WHERE order_id={order_id}
-    '''
-    query = sql.SQL(DELETE_ORDER_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('delete_order', (order_id,))
+    invalidate_results('Placed', 'OrderedDishes')
     return return_Value_select(qstatus, rows_effected)
 
 
 def add_dish(dish: Dish) -> ReturnValue:
-    ADD_DISH_QUERY_FORMAT = '''
-        INSERT INTO Dish(dish_id, name, price, is_active)
-        VALUES({dish_id}, {name}, {price}, {is_active})
-    '''
-    query = sql.SQL(ADD_DISH_QUERY_FORMAT).format(
-        dish_id = sql.Literal(dish.get_dish_id()),
-        name = sql.Literal(dish.get_name()),
-        price = sql.Literal(dish.get_price()),
-        is_active = sql.Literal(dish.get_is_active())
-    )
-    qstatus, rows_effected, _, _ = handle_query(query)
+    params = (dish.get_dish_id(), dish.get_name(), dish.get_price(), dish.get_is_active())
+    qstatus, rows_effected, _, _ = handle_prepared_query('add_dish', params)
+    invalidate_cached(DISH_CACHE, dish.get_dish_id())
+    invalidate_results('Dish')
     return qstatus
 
 def get_dish(dish_id: int) -> Dish:
-    GET_DISH_QUERY_FORMAT = f'''
-        SELECT * FROM Dish WHERE dish_id={dish_id}
-    '''
+    use_cache = not in_transaction()
+    if use_cache:
+        cached = DISH_CACHE.get(dish_id)
+        if cached is not Cache.MISSING:
+            return Dish(*cached)
+        token = DISH_CACHE.token()
+
     retObject = BadDish()
-    query = sql.SQL(GET_DISH_QUERY_FORMAT)
-    qstatus, rows_effected, rows, _ = handle_query(query)
+    qstatus, rows_effected, rows, _ = handle_prepared_query('get_dish', (dish_id,))
     qstatus = return_Value_select(qstatus, rows_effected)
 
     if qstatus == ReturnValue.OK:
-        retObject = Dish(rows[0]['dish_id'], rows[0]['name'], rows[0]['price'], rows[0]['is_active'])
+        fields = (rows[0]['dish_id'], rows[0]['name'], rows[0]['price'], rows[0]['is_active'])
+        if use_cache:
+            DISH_CACHE.put(dish_id, fields, token)
+        retObject = Dish(*fields)
     return retObject
 
 
 def update_dish_price(dish_id: int, price: float) -> ReturnValue:
-    UPDATE_DISH_PRICE_QUERY_FORMAT = f'''
-        UPDATE Dish SET price = {price} WHERE (dish_id={dish_id} AND is_active=TRUE)
-    '''
-    query = sql.SQL(UPDATE_DISH_PRICE_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('update_dish_price', (dish_id, price))
+    invalidate_cached(DISH_CACHE, dish_id)
     if ReturnValue.OK == qstatus and 0 == rows_effected:
         qstatus = ReturnValue.NOT_EXISTS
     return  qstatus
 
 def update_dish_active_status(dish_id: int, is_active: bool) -> ReturnValue:
-    UPDATE_DISH_PRICE_QUERY_FORMAT = f'''
-        UPDATE Dish SET is_active = {is_active} WHERE dish_id={dish_id}
-    '''
-    query = sql.SQL(UPDATE_DISH_PRICE_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('update_dish_active_status', (dish_id, is_active))
+    invalidate_cached(DISH_CACHE, dish_id)
     if ReturnValue.OK == qstatus and 0 == rows_effected:
         qstatus = ReturnValue.NOT_EXISTS
     return qstatus
 
 
+# every price the dish had, oldest first, as (time of the change, price)
+def get_dish_price_history(dish_id: int) -> List[Tuple[datetime, float]]:
+    query = sql.SQL('''
+        SELECT changed_at, price FROM DishPriceHistory WHERE dish_id = {dish_id} ORDER BY change_id ASC
+    ''').format(dish_id=sql.Literal(dish_id))
+    _, _, data, _ = handle_query(query)
+    if data is None:
+        return []
+    return [(row['changed_at'], float(row['price'])) for row in data]
+
+
 def customer_placed_order(customer_id: int, order_id: int) -> ReturnValue:
-    CUSTOMER_PLACED_ORDER_QUERY_FORMAT = f'''
-        INSERT INTO Placed(cust_id, order_id)
-        VALUES({customer_id}, {order_id})
-    '''
-    query = sql.SQL(CUSTOMER_PLACED_ORDER_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('customer_placed_order', (customer_id, order_id))
+    invalidate_results('Placed')
     return qstatus
 
 def get_customer_that_placed_order(order_id: int) -> Customer:
-    GET_CUSTOMER_THAT_PLACED_ORDER_QUERY = f'''
-        SELECT * FROM Customer WHERE cust_id = (SELECT cust_id FROM Placed WHERE order_id = {order_id})
-    '''
     retObject = BadCustomer()
-    query = sql.SQL(GET_CUSTOMER_THAT_PLACED_ORDER_QUERY)
-    qstatus, rows_effected, data, _ = handle_query(query)
+    qstatus, rows_effected, data, _ = handle_prepared_query('get_customer_that_placed_order', (order_id,))
     qstatus = return_Value_select(qstatus,rows_effected)
     if ReturnValue.OK == qstatus:
         retObject = Customer(data[0]['cust_id'], data[0]['full_name'], data[0]['age'], data[0]['phone'])
     return retObject    
 
 def order_contains_dish(order_id: int, dish_id: int, amount: int) -> ReturnValue:
-    ORDER_CONTAIN_DISH_QUERY_FORMAT = f'''
-        INSERT INTO OrderedDishes(order_id, dish_id, dish_amount, dish_price)
-        VALUES({order_id}, {dish_id}, {amount}, 
-            (SELECT price FROM Dish WHERE (dish_id = {dish_id} AND is_active = TRUE))
-        )
-    '''
-    query = sql.SQL(ORDER_CONTAIN_DISH_QUERY_FORMAT)
-    qstatus, rows_effected, _, exp = handle_query(query)
+    qstatus, rows_effected, _, exp = handle_prepared_query('order_contains_dish', (order_id, dish_id, amount))
+    invalidate_results('OrderedDishes')
+    return order_contains_dish_status(qstatus, rows_effected, exp)
+
+
+# a NULL price means the dish is missing or inactive
+def order_contains_dish_status(qstatus: ReturnValue, rows_effected: int, exp: Exception) -> ReturnValue:
     if isinstance(exp, DatabaseException.NOT_NULL_VIOLATION):
         qstatus = ReturnValue.NOT_EXISTS
     return qstatus
 
 
 def order_does_not_contain_dish(order_id: int, dish_id: int) -> ReturnValue:
-    DELETE_ORDER_QUERY_FORMAT = f'''
-        DELETE FROM OrderedDishes WHERE (order_id={order_id} AND dish_id={dish_id})
-    '''
-    query = sql.SQL(DELETE_ORDER_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('order_does_not_contain_dish', (order_id, dish_id))
+    invalidate_results('OrderedDishes')
     return return_Value_select(qstatus,rows_effected)
 
 def get_all_order_items(order_id: int) -> List[OrderDish]:
-    GET_ALL_ORDERED_ITEMS_QUERY = f'''
-        SELECT * FROM OrderedDishes 
-        WHERE order_id = {order_id}
-        ORDER BY dish_id ASC
-    '''
     retObject = []
-    query = sql.SQL(GET_ALL_ORDERED_ITEMS_QUERY)
-    qstatus, rows_effected, data, _ = handle_query(query)
+    qstatus, rows_effected, data, _ = handle_prepared_query('get_all_order_items', (order_id,))
     qstatus = return_Value_select(qstatus,rows_effected)
     if ReturnValue.OK == qstatus:
         retObject = [OrderDish(row['dish_id'], row['dish_amount'], row['dish_price']) for row in data]
@@ -441,35 +1443,313 @@ def get_all_order_items(order_id: int) -> List[OrderDish]:
 
 
 def customer_rated_dish(cust_id: int, dish_id: int, rating: int) -> ReturnValue:
-    CUSTOMER_DISH_RATE_QUERY_FORMAT = f'''
-        INSERT INTO DishRatings(cust_id, dish_id, rating)
-        VALUES({cust_id}, {dish_id}, {rating} 
-        )
-    '''
-    query = sql.SQL(CUSTOMER_DISH_RATE_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('customer_rated_dish', (cust_id, dish_id, rating))
+    invalidate_results('DishRatings')
     return qstatus
     
 
 def customer_deleted_rating_on_dish(cust_id: int, dish_id: int) -> ReturnValue:
-    DELETE_DISH_RATING_QUERY_FORMAT = f'''
-        DELETE FROM DishRatings WHERE (cust_id={cust_id} AND dish_id={dish_id})
-    '''
-    query = sql.SQL(DELETE_DISH_RATING_QUERY_FORMAT)
-    qstatus, rows_effected, _, _ = handle_query(query)
+    qstatus, rows_effected, _, _ = handle_prepared_query('customer_deleted_rating_on_dish', (cust_id, dish_id))
+    invalidate_results('DishRatings')
     return return_Value_select(qstatus, rows_effected)
 
 def get_all_customer_ratings(cust_id: int) -> List[Tuple[int, int]]:
-    GET_ALL_CUSTOMER_RATINGS_QUERY_FORMAT = f'''
-        SELECT * FROM DishRatings WHERE cust_id = {cust_id} ORDER BY dish_id ASC
-    '''
     retObject = []
-    query = sql.SQL(GET_ALL_CUSTOMER_RATINGS_QUERY_FORMAT)
-    qstatus, rows_effected, data, _ = handle_query(query)
+    qstatus, rows_effected, data, _ = handle_prepared_query('get_all_customer_ratings', (cust_id,))
     qstatus = return_Value_select(qstatus, rows_effected)
     if ReturnValue.OK == qstatus:
         retObject = [(row['dish_id'], row['rating']) for row in data]
     return retObject     
+# ---------------------------------- BATCHED GETTERS: ----------------------------------
+# one query for a whole list of ids, results follow the input order and a missing id
+# gets the same Bad* placeholder as the single-id getter
+
+def get_customers(customer_ids: List[int]) -> List[Customer]:
+    customer_ids = list(customer_ids)
+    qstatus, _, rows, _ = handle_prepared_query('get_customers', (customer_ids,))
+    found = {}
+    if qstatus == ReturnValue.OK:
+        found = {row['cust_id']: Customer(row['cust_id'], row['full_name'], row['age'], row['phone']) for row in rows}
+    return [found.get(cust_id, BadCustomer()) for cust_id in customer_ids]
+
+
+def get_orders(order_ids: List[int]) -> List[Order]:
+    order_ids = list(order_ids)
+    qstatus, _, rows, _ = handle_prepared_query('get_orders', (order_ids,))
+    found = {}
+    if qstatus == ReturnValue.OK:
+        found = {row['order_id']: Order(row['order_id'], row['date'], row['delivery_fee'], row['delivery_address'])
+                 for row in rows}
+    return [found.get(order_id, BadOrder()) for order_id in order_ids]
+
+
+def get_dishes(dish_ids: List[int]) -> List[Dish]:
+    dish_ids = list(dish_ids)
+    qstatus, _, rows, _ = handle_prepared_query('get_dishes', (dish_ids,))
+    found = {}
+    if qstatus == ReturnValue.OK:
+        found = {row['dish_id']: Dish(row['dish_id'], row['name'], row['price'], row['is_active']) for row in rows}
+    return [found.get(dish_id, BadDish()) for dish_id in dish_ids]
+
+
+def get_customers_that_placed_orders(order_ids: List[int]) -> List[Customer]:
+    order_ids = list(order_ids)
+    qstatus, _, rows, _ = handle_prepared_query('get_customers_that_placed_orders', (order_ids,))
+    found = {}
+    if qstatus == ReturnValue.OK:
+        found = {row['placed_order_id']: Customer(row['cust_id'], row['full_name'], row['age'], row['phone'])
+                 for row in rows}
+    return [found.get(order_id, BadCustomer()) for order_id in order_ids]
+
+# ---------------------------------- BULK API: ----------------------------------
+# The bulk functions insert a whole iterable with multi-row VALUES lists, and leave the classification of every
+# row to the database so that the results are the ones of the single-row functions. A multi-row INSERT fails as a
+# whole, so a failing batch is split in halves which are retried on their own, down to single rows which go through
+# the single-row function. k bad rows (NULL / CHECK violations, duplicate keys, values of the wrong type) cost about
+# k * log2(batch size) extra statements, a clean batch is a single INSERT.
+
+# inserts objects with query, to_params gives the VALUES row of an object
+def handle_bulk_insert(objects: list, to_params: Callable, query: str, single_insert: Callable) -> List[ReturnValue]:
+    rows = [to_params(obj) for obj in objects]
+    statuses = [None] * len(objects)
+
+    def insert(first: int, last: int) -> None:
+        if last - first == 1:
+            statuses[first] = single_insert(objects[first])
+            return
+        batch = rows[first:last]
+        qstatus, _, _, _ = execute_on_pooled_connection(
+            query, lambda conn: conn.execute_values(query, batch, BULK_INSERT_PAGE_SIZE))
+        if qstatus == ReturnValue.OK:
+            statuses[first:last] = [ReturnValue.OK] * (last - first)
+            return
+        middle = (first + last) // 2
+        insert(first, middle)
+        insert(middle, last)
+
+    if len(objects) > 0:
+        insert(0, len(objects))
+    return statuses
+
+
+def add_customers(customers: Iterable[Customer]) -> List[ReturnValue]:
+    return handle_bulk_insert(list(customers),
+                              lambda c: (c.get_cust_id(), c.get_full_name(), c.get_age(), c.get_phone()),
+                              BULK_ADD_CUSTOMERS_QUERY, add_customer)
+
+
+def add_orders(orders: Iterable[Order]) -> List[ReturnValue]:
+    return handle_bulk_insert(list(orders), add_order_params, BULK_ADD_ORDERS_QUERY, add_order)
+
+
+def add_dishes(dishes: Iterable[Dish]) -> List[ReturnValue]:
+    dishes = list(dishes)
+    statuses = handle_bulk_insert(dishes,
+                                  lambda d: (d.get_dish_id(), d.get_name(), d.get_price(), d.get_is_active()),
+                                  BULK_ADD_DISHES_QUERY, add_dish)
+    for dish in dishes:
+        invalidate_cached(DISH_CACHE, dish.get_dish_id())
+    invalidate_results('Dish')
+    return statuses
+
+# Streams (order_id, dish_id, amount) line items into OrderedDishes with COPY, chunk by chunk.
+# Every chunk resolves the active dish prices, the existing orders and the existing line items with
+# one query each, and rejects rows with the ReturnValue order_contains_dish would have returned:
+# NOT_EXISTS (NULL value, inactive/missing dish, missing order), BAD_PARAMS (amount <= 0) and
+# ALREADY_EXISTS (the order already contains the dish). Each chunk is committed on its own.
+# returns the rejected rows as (index in items, item, ReturnValue)
+def ingest_order_items(items: Iterable[Tuple[int, int, int]],
+                       chunk_size: int = ORDER_ITEMS_INGEST_CHUNK_SIZE) -> List[Tuple[int, Tuple[int, int, int], ReturnValue]]:
+    rejected = []
+    items = iter(items)
+    first_index = 0
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if len(chunk) == 0:
+            break
+        rejected += ingest_order_items_chunk(chunk, first_index)
+        first_index += len(chunk)
+    return rejected
+
+
+def ingest_order_items_chunk(chunk: list, first_index: int) -> List[Tuple[int, Tuple[int, int, int], ReturnValue]]:
+    rejected = []
+    accepted = []
+
+    def ingest(conn):
+        rejected.clear()
+        accepted.clear()
+        dish_ids = list(set(dish_id for _, dish_id, _ in chunk if dish_id is not None))
+        order_ids = list(set(order_id for order_id, _, _ in chunk if order_id is not None))
+        _, prices = conn.execute(INGEST_ACTIVE_DISH_PRICES_QUERY, params=(dish_ids,))
+        _, orders = conn.execute(INGEST_EXISTING_ORDERS_QUERY, params=(order_ids,))
+        _, order_items = conn.execute(INGEST_EXISTING_ORDER_ITEMS_QUERY, params=(order_ids,))
+        price_of = {row['dish_id']: row['price'] for row in prices}
+        existing_orders = set(row['order_id'] for row in orders)
+        existing_items = set((row['order_id'], row['dish_id']) for row in order_items)
+
+        # same precedence as the single row INSERT: NOT NULL, then CHECK, then UNIQUE, then FOREIGN KEY
+        for index, (order_id, dish_id, amount) in enumerate(chunk, first_index):
+            if order_id is None or amount is None or dish_id not in price_of:
+                status = ReturnValue.NOT_EXISTS
+            elif amount <= 0:
+                status = ReturnValue.BAD_PARAMS
+            elif (order_id, dish_id) in existing_items:
+                status = ReturnValue.ALREADY_EXISTS
+            elif order_id not in existing_orders:
+                status = ReturnValue.NOT_EXISTS
+            else:
+                status = ReturnValue.OK
+                existing_items.add((order_id, dish_id))
+                accepted.append((order_id, dish_id, amount, price_of[dish_id]))
+            if status != ReturnValue.OK:
+                rejected.append((index, (order_id, dish_id, amount), status))
+
+        copied = conn.copy_rows('OrderedDishes', ['order_id', 'dish_id', 'dish_amount', 'dish_price'], accepted)
+        return copied, Connector.ResultSet()
+
+    qstatus, _, _, _ = execute_on_pooled_connection('COPY OrderedDishes FROM STDIN', ingest)
+    invalidate_results('OrderedDishes')
+    if qstatus == ReturnValue.OK:
+        return rejected
+
+    # the chunk raced with another writer, replay it row by row
+    rejected = []
+    for index, item in enumerate(chunk, first_index):
+        status = order_contains_dish(*item)
+        if status != ReturnValue.OK:
+            rejected.append((index, item, status))
+    return rejected
+
+# ---------------------------------- PIPELINE API: ----------------------------------
+# operation name -> (CRUD statement, arguments -> statement params, (qstatus, rows effected, exception) -> ReturnValue)
+PIPELINE_OPERATIONS = {
+    'add_order': ('add_order', add_order_params, lambda qstatus, rows, exp: qstatus),
+    'delete_order': ('delete_order', lambda order_id: (order_id,),
+                     lambda qstatus, rows, exp: return_Value_select(qstatus, rows)),
+    'customer_placed_order': ('customer_placed_order', lambda cust_id, order_id: (cust_id, order_id),
+                              lambda qstatus, rows, exp: qstatus),
+    'order_contains_dish': ('order_contains_dish', lambda order_id, dish_id, amount: (order_id, dish_id, amount),
+                            order_contains_dish_status),
+    'order_does_not_contain_dish': ('order_does_not_contain_dish', lambda order_id, dish_id: (order_id, dish_id),
+                                    lambda qstatus, rows, exp: return_Value_select(qstatus, rows)),
+    'customer_rated_dish': ('customer_rated_dish', lambda cust_id, dish_id, rating: (cust_id, dish_id, rating),
+                            lambda qstatus, rows, exp: qstatus),
+    'customer_deleted_rating_on_dish': ('customer_deleted_rating_on_dish',
+                                        lambda cust_id, dish_id: (cust_id, dish_id),
+                                        lambda qstatus, rows, exp: return_Value_select(qstatus, rows)),
+}
+
+STATEMENT_PARAMETER = re.compile(r'\$(\d+)')
+
+
+# the CRUD statement with its $n parameters replaced by the literal values
+def bind_statement(statement_name: str, params: tuple) -> sql.Composed:
+    parts = STATEMENT_PARAMETER.split(CRUD_STATEMENTS[statement_name])
+    return sql.Composed([sql.Literal(params[int(part) - 1]) if index % 2 else sql.SQL(part)
+                         for index, part in enumerate(parts)])
+
+
+# Sends a checkout-like sequence of writes to the database in one round trip, e.g.
+#     pipeline([('add_order', (order,)), ('customer_placed_order', (7, 1)), ('order_contains_dish', (1, 3, 2))])
+# the operations run in the given order, each returns the ReturnValue of the function of the same name and
+# a failing operation only undoes itself. the whole pipeline is committed at once (or joins the current
+# Solution.transaction()). only the operations of PIPELINE_OPERATIONS are supported, others raise ValueError
+def pipeline(operations: Iterable[Tuple[str, tuple]]) -> List[ReturnValue]:
+    operations = list(operations)
+    for name, _ in operations:
+        if name not in PIPELINE_OPERATIONS:
+            raise ValueError(f'{name} can not be pipelined')
+    if len(operations) == 0:
+        return []
+
+    queries = []
+    for name, args in operations:
+        statement_name, to_params, _ = PIPELINE_OPERATIONS[name]
+        queries.append(bind_statement(statement_name, to_params(*args)))
+
+    def run(conn):
+        results = conn.execute_batch(queries)
+        return len(results), results
+
+    qstatus, _, results, exp = execute_on_pooled_connection('pipeline', run)
+    invalidate_results('Placed', 'OrderedDishes', 'DishRatings')
+    if qstatus != ReturnValue.OK:
+        return [qstatus] * len(operations)
+
+    statuses = []
+    for (name, _), (rows_effected, exp) in zip(operations, results):
+        _, _, to_status = PIPELINE_OPERATIONS[name]
+        status = ReturnValue.OK if exp is None else handle_database_exceptions(name, exp, DEBUG_FLAG)
+        statuses.append(to_status(status, rows_effected, exp))
+    return statuses
+
+# ---------------------------------- CHECKOUT API: ----------------------------------
+# Creates the order, places it by cust_id (None for an anonymous order) and adds every (dish_id, amount) of
+# items in one statement and one commit, the lines are priced at the current price of their dish.
+# returns the order status and one status per line, each being what the matching call would have returned:
+#   order: add_order, then customer_placed_order - on failure nothing is written and every line gets its status
+#   line:  order_contains_dish in basket order - NOT_EXISTS (missing / inactive dish, NULL value),
+#          BAD_PARAMS (amount <= 0), ALREADY_EXISTS (an earlier line of the basket holds the dish)
+def place_order(order: Order, cust_id: int, items: Iterable[Tuple[int, int]]) -> Tuple[ReturnValue, List[ReturnValue]]:
+    items = list(items)
+    order_id, order_date, delivery_fee, delivery_address = add_order_params(order)
+    params = {'order_id': order_id, 'date': order_date, 'delivery_fee': delivery_fee,
+              'delivery_address': delivery_address, 'cust_id': cust_id,
+              'dish_ids': [dish_id for dish_id, _ in items], 'amounts': [amount for _, amount in items]}
+
+    def place(conn):
+        return conn.execute(PLACE_ORDER_QUERY, params=params)
+
+    qstatus, _, data, _ = execute_on_pooled_connection(PLACE_ORDER_QUERY, place)
+    invalidate_results('Placed', 'OrderedDishes')
+    if qstatus != ReturnValue.OK:
+        return qstatus, [qstatus] * len(items)
+
+    # replay the line selection of the statement: NOT NULL, then CHECK, then UNIQUE
+    active_lines = set(row['line'] for row in data)
+    added_dishes = set()
+    statuses = []
+    for line, (dish_id, amount) in enumerate(items, 1):
+        if line not in active_lines or amount is None:
+            statuses.append(ReturnValue.NOT_EXISTS)
+        elif amount <= 0:
+            statuses.append(ReturnValue.BAD_PARAMS)
+        elif dish_id in added_dishes:
+            statuses.append(ReturnValue.ALREADY_EXISTS)
+        else:
+            added_dishes.add(dish_id)
+            statuses.append(ReturnValue.OK)
+    return ReturnValue.OK, statuses
+
+# ---------------------------------- EXPORT API: ----------------------------------
+# constant memory iteration over whole tables for reporting jobs
+
+def iter_all_orders(itersize: int = Connector.STREAM_ITERSIZE) -> Iterator[Order]:
+    query = sql.SQL('''
+        SELECT * FROM Orders ORDER BY order_id ASC
+    ''')
+    for row in stream_query(query, itersize):
+        yield Order(row['order_id'], row['date'], row['delivery_fee'], row['delivery_address'])
+
+
+# (order_id, OrderDish) for every line item
+def iter_all_order_items(itersize: int = Connector.STREAM_ITERSIZE) -> Iterator[Tuple[int, OrderDish]]:
+    query = sql.SQL('''
+        SELECT * FROM OrderedDishes ORDER BY order_id ASC, dish_id ASC
+    ''')
+    for row in stream_query(query, itersize):
+        yield row['order_id'], OrderDish(row['dish_id'], row['dish_amount'], row['dish_price'])
+
+
+# (cust_id, dish_id, rating) for every rating
+def iter_all_ratings(itersize: int = Connector.STREAM_ITERSIZE) -> Iterator[Tuple[int, int, int]]:
+    query = sql.SQL('''
+        SELECT * FROM DishRatings ORDER BY cust_id ASC, dish_id ASC
+    ''')
+    for row in stream_query(query, itersize):
+        yield row['cust_id'], row['dish_id'], row['rating']
+
 # ---------------------------------- BASIC API: ----------------------------------
 
 # Basic API
@@ -489,20 +1769,23 @@ def get_order_total_price(order_id: int) -> float:
 
 def get_customers_spent_max_avg_amount_money() -> List[int]:
     #:including dekiveryfee see in oazzza @34
+    # one aggregation pass over Placed JOIN OrdersSum, the maximum is a window over the per-customer averages.
+    # Placed only holds non anonymous orders, so it replaces CustomersOrders ... WHERE cust_id IS NOT NULL
     GET_CUSTOMERS_SPENT_MAX_AVG_AMOUNT_MONY_QUERY_FORMAT = '''
-        SELECT Co.cust_id
-        FROM CustomersOrders AS Co JOIN OrdersSum AS Os ON(Co.order_id = Os.order_id)
-        WHERE Co.cust_id IS NOT NULL
-        GROUP BY Co.cust_id
-        HAVING  SUM(Os.total + Os.delivery_fee)/COALESCE(COUNT(*),1) = (
-                    SELECT  sum(OrdersSum.total + OrdersSum.delivery_fee)/COALESCE(COUNT(*),1) max
-                    FROM CustomersOrders JOIN OrdersSum ON(CustomersOrders.order_id = OrdersSum.order_id)
-                    WHERE  CustomersOrders.cust_id IS NOT NULL 
-                    GROUP BY CustomersOrders.cust_id                      
-                    ORDER BY SUM(OrdersSum.total + OrdersSum.delivery_fee)/COALESCE(COUNT(*),1) DESC
-                    LIMIT 1 )
-        ORDER BY Co.cust_id ASC
-    ''' 
+        WITH CustomerAverages AS (
+            SELECT Placed.cust_id AS cust_id,
+                   SUM(Os.total + Os.delivery_fee)/COALESCE(COUNT(*),1) AS avg_spent
+            FROM Placed JOIN OrdersSum AS Os ON(Placed.order_id = Os.order_id)
+            GROUP BY Placed.cust_id
+        ), RankedAverages AS (
+            SELECT cust_id, avg_spent, MAX(avg_spent) OVER () AS max_avg_spent
+            FROM CustomerAverages
+        )
+        SELECT cust_id
+        FROM RankedAverages
+        WHERE avg_spent = max_avg_spent
+        ORDER BY cust_id ASC
+    '''
     query = sql.SQL(GET_CUSTOMERS_SPENT_MAX_AVG_AMOUNT_MONY_QUERY_FORMAT)
     _, _, data, _ = handle_query(query)
     if data is None:
@@ -533,7 +1816,17 @@ def get_most_purchased_dish_among_anonymous_order() -> Dish:
     return Dish(data[0]['dish_id'], data[0]['name'], data[0]['price'], data[0]['is_active'])
 
 
+# with RESULT_CACHE enabled the answer is read from the cached bitmap (see did_customers_order_top_rated_dishes),
+# or else computed against the cached top 5 dishes
 def did_customer_order_top_rated_dishes(cust_id: int) -> bool:
+    if result_cache_enabled():
+        bitmap = RESULT_CACHE.get('top_rated_dishes_bitmap')
+        if bitmap is not Cache.MISSING:
+            return bitmap.get(cust_id, 0) != 0
+        top_rated = cached_result('top_rated_dishes', query_top_rated_dishes)
+        if top_rated is not None:
+            return customer_ordered_any_dish(cust_id, top_rated)
+
     DID_CUSTOMER_ORDER_TOP_RATED_DISHES_QUERY_FORMAT = '''
 
     SELECT DISTINCT  CustomersOrders.cust_id
@@ -554,6 +1847,70 @@ def did_customer_order_top_rated_dishes(cust_id: int) -> bool:
     _, rows_amount, _, _ = handle_query(query)
     return rows_amount > 0
 
+
+# the answer of did_customer_order_top_rated_dishes for every customer of cust_ids, from one query.
+# with RESULT_CACHE enabled (it is opt-in, see RESULT_CACHE_SIZE) the bitmap of all the customers is built once
+# and kept until a rating, dish, line item or placement is written, so later checks are in-memory lookups.
+# otherwise a single query computes the bitmap of the given customers only
+def did_customers_order_top_rated_dishes(cust_ids: Iterable[int]) -> List[bool]:
+    cust_ids = list(cust_ids)
+    if result_cache_enabled():
+        bitmap = cached_result('top_rated_dishes_bitmap', query_top_rated_dishes_bitmap)
+    else:
+        bitmap = query_top_rated_dishes_bitmap(list(set(cust_id for cust_id in cust_ids if cust_id is not None)))
+    if bitmap is None:
+        return [False] * len(cust_ids)
+    return [bitmap.get(cust_id, 0) != 0 for cust_id in cust_ids]
+
+
+# the 5 highest rated dishes, best first. None if the query failed
+def query_top_rated_dishes() -> List[int]:
+    query = sql.SQL('''
+        SELECT dish_id
+        FROM RatingScore
+        ORDER BY avg_rating DESC, dish_id ASC
+        LIMIT 5
+    ''')
+    _, _, data, _ = handle_query(query)
+    if data is None:
+        return None
+    return [row['dish_id'] for row in data]
+
+
+# cust_id -> bitmask of the top 5 dishes the customer ordered (bit i for the i-th best dish), customers that
+# ordered none of them are left out. restricted to cust_ids when given. None if the query failed
+def query_top_rated_dishes_bitmap(cust_ids: List[int] = None) -> dict:
+    query = sql.SQL('''
+        WITH TopRated AS (
+            SELECT dish_id, (ROW_NUMBER() OVER (ORDER BY avg_rating DESC, dish_id ASC) - 1)::INTEGER AS bit
+            FROM RatingScore
+            ORDER BY avg_rating DESC, dish_id ASC
+            LIMIT 5
+        )
+        SELECT Placed.cust_id AS cust_id, BIT_OR(1 << TopRated.bit) AS mask
+        FROM Placed
+            JOIN OrderedDishes ON (Placed.order_id = OrderedDishes.order_id)
+            JOIN TopRated ON (OrderedDishes.dish_id = TopRated.dish_id)
+        {customers_filter}
+        GROUP BY Placed.cust_id
+    ''').format(customers_filter=sql.SQL('') if cust_ids is None else
+                sql.SQL('WHERE Placed.cust_id = ANY({})').format(sql.Literal(cust_ids)))
+    _, _, data, _ = handle_query(query)
+    if data is None:
+        return None
+    return {row['cust_id']: row['mask'] for row in data}
+
+
+def customer_ordered_any_dish(cust_id: int, dish_ids: List[int]) -> bool:
+    query = sql.SQL('''
+        SELECT 1
+        FROM Placed JOIN OrderedDishes ON (Placed.order_id = OrderedDishes.order_id)
+        WHERE Placed.cust_id = {cust_id} AND OrderedDishes.dish_id = ANY({dish_ids})
+        LIMIT 1
+    ''').format(cust_id=sql.Literal(cust_id), dish_ids=sql.Literal(dish_ids))
+    _, rows_amount, _, _ = handle_query(query)
+    return rows_amount > 0
+
 # ---------------------------------- ADVANCED API: ----------------------------------
 
 # Advanced API
@@ -567,30 +1924,34 @@ def testSolutionQuery():
         LIMIT 5
     '''
 
+# served from RESULT_CACHE when it is enabled, see configure_caches
 def get_customers_rated_but_not_ordered() -> List[int]:
-    GET_MIN_RATED_DISHES = '''
-        SELECT dish_id
+    result = cached_result('get_customers_rated_but_not_ordered', query_customers_rated_but_not_ordered)
+    return [] if result is None else list(result)
+
+
+# the 5 lowest rated dishes are computed once, the low ratings of those dishes are then anti-joined
+# (NOT EXISTS, executed as a hash anti join) with the dishes each customer ordered. None if the query failed
+def query_customers_rated_but_not_ordered() -> List[int]:
+    GET_CUSTOMER_RATED_BUT_NOT_ORDER_QUERY_FORMAT = '''
+        WITH LowestRated AS (
+            SELECT dish_id
             FROM RatingScore
             ORDER BY avg_rating ASC, dish_id ASC
             LIMIT 5
-    '''
-    GET_CUSTOMER_RATED_BUT_NOT_ORDER_QUERY_FORMAT = f'''
-        SELECT DISTINCT(cust_low_ratings.cust_id) AS cust_id FROM 
-        (
-            SELECT cust_id, dish_id FROM DishRatings 
-            WHERE rating < 3
-        ) cust_low_ratings
-        WHERE cust_low_ratings.dish_id IN ({GET_MIN_RATED_DISHES}) 
-        AND cust_low_ratings.dish_id NOT IN 
-        (
-            SELECT cd.dish_id FROM CustomerOrderedDishes cd 
-            WHERE cd.cust_id = cust_low_ratings.cust_id
+        )
+        SELECT DISTINCT dr.cust_id AS cust_id
+        FROM DishRatings dr JOIN LowestRated ON (dr.dish_id = LowestRated.dish_id)
+        WHERE dr.rating < 3
+        AND NOT EXISTS (
+            SELECT 1 FROM OrderedDishes od JOIN Placed p ON (p.order_id = od.order_id)
+            WHERE p.cust_id = dr.cust_id AND od.dish_id = dr.dish_id
         ) ORDER BY cust_id ASC;
     '''
     query = sql.SQL(GET_CUSTOMER_RATED_BUT_NOT_ORDER_QUERY_FORMAT)
     _, _, data, _ = handle_query(query)
     if data is None:
-        return []
+        return None
     return [row['cust_id'] for row in data]
 
 
@@ -617,61 +1978,93 @@ def get_non_worth_price_increase() -> List[int]:
 
 
 def get_cumulative_profit_per_month(year: int) -> List[Tuple[int, float]]:
-    GET_CUMULACTIVE_PROFILE_PER_MONTH_QUERY_FORMAT = '''
-        SELECT COALESCE(SUM(total),0) AS val, coordinate.j AS month
-        FROM 
-            (SELECT *FROM (SELECT 1 AS i UNION ALL  SELECT 2 UNION ALL SELECT 3 
-                UNION ALL SELECT 4 UNION ALL SELECT 5
-                UNION ALL SELECT 6 UNION ALL SELECT 7 
-                UNION ALL SELECT 8 UNION ALL SELECT 9
-                UNION ALL SELECT 10 UNION ALL SELECT 11
-                UNION ALL SELECT 12)   ,(SELECT 1 AS j UNION ALL  SELECT 2 UNION ALL SELECT 3 
-                UNION ALL SELECT 4 UNION ALL SELECT 5
-                UNION ALL SELECT 6 UNION ALL SELECT 7 
-                UNION ALL SELECT 8 UNION ALL SELECT 9
-                UNION ALL SELECT 10 UNION ALL SELECT 11
-                UNION ALL SELECT 12)
-                WHERE i <=j
-                ) AS coordinate LEFT JOIN (
-                    (SELECT     Orders.order_id AS order_id,
-                                OrdersSum.total + OrdersSum.delivery_fee AS total,
-                                EXTRACT(MONTH  FROM  Orders.date) AS month
-                    FROM Orders JOIN OrdersSum ON (Orders.order_id = OrdersSum.order_id)
-                    WHERE EXTRACT(YEAR FROM  Orders.date) = {year} ) 
-                )ON(coordinate.i = month)
-                group by coordinate.j
-                ORDER BY  coordinate.j DESC
-    '''
-    query = sql.SQL(GET_CUMULACTIVE_PROFILE_PER_MONTH_QUERY_FORMAT).format(
-        year=sql.Literal(year)
+    # an order can not be dated outside the years of datetime, such a year has no profit
+    if not MINYEAR <= year <= MAXYEAR:
+        return [(month, 0.0) for month in range(12, 0, -1)]
+    profit = get_cumulative_profit(date(year, 1, 1), date(year, 12, 31), 'month')
+    return [(bucket.month, cumulative) for bucket, cumulative in zip(profit.buckets, profit.cumulative)][::-1]
+
+
+# buckets of get_cumulative_profit, named as in date_trunc
+PROFIT_GRANULARITIES = {'day': '1 day', 'week': '1 week', 'month': '1 month'}
+
+
+# get_cumulative_profit result: bucket i starts at buckets[i], revenue[i] is the profit of the orders of the range
+# falling in it and cumulative[i] the profit of the range up to and including it
+class CumulativeProfit(NamedTuple):
+    buckets: List[date]
+    revenue: array
+    cumulative: array
+
+
+# Profit (delivery fees plus line items) of the orders dated start_date..end_date (both included) per day, week
+# (starting on Monday) or month, with the running total, in one query. the first and the last buckets start at
+# the day / week / month holding start_date / end_date. ranges of whole months are read from MonthlyRevenue,
+# other ranges aggregate the orders of the range through orders_date_idx
+def get_cumulative_profit(start_date: date, end_date: date, granularity: str = 'month') -> CumulativeProfit:
+    if granularity not in PROFIT_GRANULARITIES:
+        raise ValueError(f'granularity must be one of {list(PROFIT_GRANULARITIES)}')
+
+    whole_months = (granularity == 'month' and start_date.day == 1
+                    and end_date.day == monthrange(end_date.year, end_date.month)[1])
+    if whole_months:
+        GET_CUMULATIVE_PROFIT_QUERY_FORMAT = '''
+            SELECT buckets.bucket::DATE AS bucket, COALESCE(MonthlyRevenue.revenue, 0) AS revenue,
+                   SUM(COALESCE(MonthlyRevenue.revenue, 0)) OVER (ORDER BY buckets.bucket) AS cumulative
+            FROM generate_series({start_date}::TIMESTAMP, {end_date}::TIMESTAMP, INTERVAL '1 month') AS buckets(bucket)
+                LEFT JOIN MonthlyRevenue ON (MonthlyRevenue.year = EXTRACT(YEAR FROM buckets.bucket)::INTEGER
+                                             AND MonthlyRevenue.month = EXTRACT(MONTH FROM buckets.bucket)::INTEGER)
+            ORDER BY buckets.bucket ASC
+        '''
+    else:
+        GET_CUMULATIVE_PROFIT_QUERY_FORMAT = '''
+            WITH revenue AS (
+                SELECT date_trunc({granularity}, Orders.date) AS bucket,
+                       SUM(OrderTotals.total + Orders.delivery_fee) AS revenue
+                FROM Orders JOIN OrderTotals ON (Orders.order_id = OrderTotals.order_id)
+                WHERE Orders.date >= {start_date} AND Orders.date < {end_date} + 1
+                GROUP BY 1
+            )
+            SELECT buckets.bucket::DATE AS bucket, COALESCE(revenue.revenue, 0) AS revenue,
+                   SUM(COALESCE(revenue.revenue, 0)) OVER (ORDER BY buckets.bucket) AS cumulative
+            FROM generate_series(date_trunc({granularity}, {start_date}::TIMESTAMP),
+                                 date_trunc({granularity}, {end_date}::TIMESTAMP),
+                                 {step}::INTERVAL) AS buckets(bucket)
+                LEFT JOIN revenue ON (revenue.bucket = buckets.bucket)
+            ORDER BY buckets.bucket ASC
+        '''
+    query = sql.SQL(GET_CUMULATIVE_PROFIT_QUERY_FORMAT).format(
+        start_date=sql.Literal(start_date), end_date=sql.Literal(end_date),
+        granularity=sql.Literal(granularity), step=sql.Literal(PROFIT_GRANULARITIES[granularity])
     )
     _, _, data, _ = handle_query(query)
     if data is None:
-        return []  
-    return [(row['month'], float(row['val'])) for row in data]
+        return CumulativeProfit([], array('d'), array('d'))
+    return CumulativeProfit([row['bucket'] for row in data],
+                            array('d', (float(row['revenue']) for row in data)),
+                            array('d', (float(row['cumulative']) for row in data)))
 
 
 def get_potential_dish_recommendations(cust_id: int) -> List[int]:
-    SELECTION_QUERY = f'''
-    SELECT * FROM
+    # the customers similar to cust_id are exactly the other members of its similarity component
+    SELECTION_QUERY = '''
+    SELECT dish_id FROM
     (
-        (SELECT dish_id FROM
-        (
-            (SELECT b FROM
-                (WITH RECURSIVE a_similar_b AS (
-                    SELECT * FROM SimilarRelation
-                    UNION 
-                    SELECT a_to_b.a, b_to_c.b
-                    FROM a_similar_b a_to_b JOIN SimilarRelation b_to_c ON a_to_b.b = b_to_c.a
-                ) SELECT * FROM a_similar_b where a != b)
-            WHERE a = {cust_id})
-        ) rs JOIN DishRatings dr ON dr.cust_id = rs.b
-        WHERE dr.rating >= 4)
-        EXCEPT (SELECT dish_id FROM CustomerOrderedDishes WHERE cust_id = {cust_id})
-    ) ORDER BY dish_id ASC;
+        SELECT dr.dish_id
+        FROM CustomerSimilarity me
+            JOIN CustomerSimilarity other
+                ON other.component_id = me.component_id AND other.cust_id != me.cust_id
+            JOIN DishRatings dr ON dr.cust_id = other.cust_id
+        WHERE me.cust_id = {cust_id} AND dr.rating >= 4
+        EXCEPT
+        SELECT dish_id FROM CustomerOrderedDishes WHERE cust_id = {cust_id}
+    ) recommended
+    ORDER BY dish_id ASC;
     '''
-    query = sql.SQL(SELECTION_QUERY)
+    query = sql.SQL(SELECTION_QUERY).format(
+        cust_id=sql.Literal(cust_id)
+    )
     _, _, data, _ = handle_query(query)
     if data is None:
         return []
-    return [row['dish_id'] for row in data]
\ No newline at end of file
+    return [row['dish_id'] for row in data]
@@ -0,0 +1,122 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import Solution
+import Utility.DBConnector as Connector
+
+'''
+    asyncio variant of the Solution API:
+
+        import SolutionAio as aio
+        await aio.add_order(order)
+        results = await asyncio.gather(*(aio.get_order_total_price(i) for i in order_ids))
+
+    every function of the Solution API has a coroutine of the same name, with the same arguments and the same
+    ReturnValue / business object results. the calls run on a thread pool as large as the connection pool, so up
+    to pool max_size of them hit the database concurrently and the event loop never blocks on psycopg2; any
+    further calls wait in the executor queue rather than holding a thread that waits on the pool. the executor is
+    sized from the pool bounds without creating the pool, which is created by the first call on a worker thread, so
+    neither connecting nor a database that is down ever blocks the event loop.
+    Solution.transaction() is bound to a thread and cannot span awaits, use run_in_transaction() instead.
+
+    concurrency limit: psycopg2 is blocking, so every call in flight holds a worker thread and a pooled connection.
+    with the default pool (Connector.POOL_MAX_SIZE = 10) at most 10 calls run at once, however many coroutines are
+    gathered; the rest queue up. to serve hundreds of concurrent calls, raise the limit before the event loop
+    starts (the server's max_connections must allow it):
+
+        aio.configure(max_concurrency=200)
+'''
+
+# the Solution functions exposed as coroutines
+ASYNC_API_NAMES = [
+    'create_tables', 'clear_tables', 'drop_tables',
+    'check_orders_sum_consistency', 'check_rating_score_consistency', 'rebuild_similarity', 'rebuild_orders_sum',
+    'rebuild_dish_price_stats', 'rebuild_monthly_revenue',
+    # CRUD API
+    'add_customer', 'get_customer', 'delete_customer',
+    'add_order', 'get_order', 'delete_order',
+    'add_dish', 'get_dish', 'update_dish_price', 'update_dish_active_status', 'get_dish_price_history',
+    'customer_placed_order', 'get_customer_that_placed_order',
+    'order_contains_dish', 'order_does_not_contain_dish', 'get_all_order_items',
+    'customer_rated_dish', 'customer_deleted_rating_on_dish', 'get_all_customer_ratings',
+    'get_customers', 'get_orders', 'get_dishes', 'get_customers_that_placed_orders',
+    # bulk API
+    'add_customers', 'add_orders', 'add_dishes', 'ingest_order_items',
+    # pipeline / checkout API
+    'pipeline', 'place_order',
+    # BASIC API
+    'get_order_total_price', 'get_customers_spent_max_avg_amount_money',
+    'get_most_purchased_dish_among_anonymous_order', 'did_customer_order_top_rated_dishes',
+    'did_customers_order_top_rated_dishes',
+    # ADVANCED API
+    'get_customers_rated_but_not_ordered', 'get_non_worth_price_increase',
+    'get_cumulative_profit_per_month', 'get_cumulative_profit', 'get_potential_dish_recommendations',
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Connector.pool_max_size(), thread_name_prefix='solution-aio')
+        return _executor
+
+
+# replace the executor (e.g. after Connector.configure_pool), the old one finishes its queued calls
+def configure_executor(max_workers: int = None) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ThreadPoolExecutor(max_workers=max_workers or Connector.pool_max_size(),
+                                       thread_name_prefix='solution-aio')
+        return _executor
+
+
+# size the connection pool and the executor together, at most max_concurrency calls run at once.
+# replacing the pool opens its min_size connections on the calling thread, so call it outside the event loop
+def configure(max_concurrency: int = Connector.POOL_MAX_SIZE, **pool_options) -> None:
+    pool_options.setdefault('min_size', min(Connector.POOL_MIN_SIZE, max_concurrency))
+    Connector.configure_pool(max_size=max_concurrency, **pool_options)
+    configure_executor(max_concurrency)
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+async def run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+# run fn(*args) inside one Solution.transaction() on a single worker thread, e.g.
+#     def place(order, cust_id): return Solution.add_order(order), Solution.customer_placed_order(cust_id, order.get_order_id())
+#     await run_in_transaction(place, order, 7)
+async def run_in_transaction(fn, *args, **kwargs):
+    def in_transaction():
+        with Solution.transaction():
+            return fn(*args, **kwargs)
+    return await run(in_transaction)
+
+
+def _make_coroutine(fn):
+    @functools.wraps(fn)
+    async def coroutine(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return coroutine
+
+
+for _name in ASYNC_API_NAMES:
+    globals()[_name] = _make_coroutine(getattr(Solution, _name))
+del _name
+
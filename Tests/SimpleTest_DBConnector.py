@@ -0,0 +1,297 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from collections import namedtuple
+from configparser import ConfigParser
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+
+import Utility.DBConnector as Connector
+from Utility.Exceptions import DatabaseException
+
+'''
+    Tests for Utility/DBConnector.py which do not need a database:
+    psycopg2.connect is replaced by FakeConnection
+    make sure the tests' names start with test
+'''
+
+Column = namedtuple('Column', ['name', 'type_code'])
+Notify = namedtuple('Notify', ['pid', 'channel', 'payload'])
+DESCRIPTION = [Column('id', 23), Column('price', 1700), Column('name', 25), Column('placed', 1114)]
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        self.connection.executed.append(query)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeConnection:
+    def __init__(self, **params):
+        self.params = params
+        self.autocommit = True
+        self.closed = 0
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.notifies = []
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def poll(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class Test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.connections = []
+
+        def connect(**params):
+            connection = FakeConnection(**params)
+            self.connections.append(connection)
+            return connection
+
+        patcher = mock.patch.object(Connector.psycopg2, 'connect', side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connector(self) -> None:
+        conn = Connector.DBConnector()
+        self.assertEqual(1, len(self.connections), 'test 1.1')
+        self.assertEqual(Connector.load_config(), self.connections[0].params, 'test 1.2')
+        self.assertEqual(False, self.connections[0].autocommit, 'test 1.3')
+        self.assertEqual(0, conn.execute("SELECT 1")[0], 'test 1.4')
+        self.assertEqual(["SELECT 1"], self.connections[0].executed, 'test 1.5')
+        conn.close()
+        self.assertEqual(1, self.connections[0].closed, 'test 1.6')
+
+    def test_connector_failure(self) -> None:
+        with mock.patch.object(Connector.psycopg2, 'connect', side_effect=Exception('refused')):
+            with self.assertRaises(DatabaseException.ConnectionInvalid):
+                Connector.DBConnector()
+
+    def test_pool_max_size(self) -> None:
+        with mock.patch.object(Connector, '_pool', None):
+            self.assertEqual(Connector.POOL_MAX_SIZE, Connector.pool_max_size(), 'test 2.1')
+            self.assertEqual([], self.connections, 'test 2.2')
+            pool = Connector.configure_pool(min_size=0, max_size=3)
+            self.assertEqual(3, Connector.pool_max_size(), 'test 2.3')
+            pool.close()
+
+    def test_result_set_columns(self) -> None:
+        empty = Connector.ResultSet(DESCRIPTION, [])
+        self.assertEqual({'id': [], 'price': [], 'name': [], 'placed': []}, empty.to_columns(), 'test 3.1')
+        self.assertEqual([], empty['price'], 'test 3.2')
+
+        placed = datetime(2024, 1, 1, 12)
+        single = Connector.ResultSet(DESCRIPTION, [(1, Decimal('9.5'), 'pizza', placed)])
+        self.assertEqual({'id': [1], 'price': [Decimal('9.5')], 'name': ['pizza'], 'placed': [placed]},
+                         single.to_columns(), 'test 3.3')
+
+        mixed = Connector.ResultSet(DESCRIPTION, [(1, Decimal('9.5'), 'pizza', placed), (2, None, None, None)])
+        self.assertEqual({'id': [1, 2], 'price': [Decimal('9.5'), None], 'name': ['pizza', None],
+                          'placed': [placed, None]}, mixed.to_columns(), 'test 3.4')
+        self.assertEqual({}, Connector.ResultSet().to_columns(), 'test 3.5')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_result_set_numpy(self) -> None:
+        empty = Connector.ResultSet(DESCRIPTION, []).to_numpy()
+        self.assertEqual(['id', 'price', 'name', 'placed'], list(empty), 'test 4.1')
+        self.assertEqual([0] * 4, [len(array) for array in empty.values()], 'test 4.2')
+        self.assertEqual([numpy.int64, numpy.float64, numpy.object_, numpy.dtype('datetime64[us]')],
+                         [array.dtype for array in empty.values()], 'test 4.3')
+
+        single = Connector.ResultSet(DESCRIPTION, [(1, Decimal('9.5'), 'pizza', datetime(2024, 1, 1))]).to_numpy()
+        self.assertEqual(numpy.int64, single['id'].dtype, 'test 4.4')
+        self.assertEqual([9.5], single['price'].tolist(), 'test 4.5')
+
+        mixed = Connector.ResultSet(DESCRIPTION, [(1, Decimal('9.5'), 'pizza', None), (None, None, 1, None)])
+        mixed = mixed.to_numpy()
+        self.assertEqual(numpy.float64, mixed['id'].dtype, 'test 4.6')
+        self.assertTrue(numpy.isnan(mixed['price'][1]), 'test 4.7')
+        self.assertEqual(['pizza', 1], mixed['name'].tolist(), 'test 4.8')
+        self.assertEqual(numpy.dtype('datetime64[us]'), mixed['placed'].dtype, 'test 4.9')
+        self.assertTrue(numpy.isnat(mixed['placed']).all(), 'test 4.10')
+
+
+    def test_pool(self) -> None:
+        pool = Connector.ConnectionPool(min_size=1, max_size=2, checkout_timeout=0.05, health_check_after=60)
+        self.assertEqual(1, len(self.connections), 'test 5.1')
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertEqual(2, len(self.connections), 'test 5.2')
+        self.assertEqual({'size': 2, 'idle': 0, 'in_use': 2, 'checkouts': 2, 'creations': 2},
+                         {key: pool.stats()[key] for key in ('size', 'idle', 'in_use', 'checkouts', 'creations')},
+                         'test 5.3')
+
+        # max_size bounds the pool, a third borrower times out
+        with self.assertRaises(DatabaseException.ConnectionInvalid):
+            pool.acquire()
+        self.assertEqual(1, pool.stats()['waits'], 'test 5.4')
+        self.assertEqual(2, len(self.connections), 'test 5.5')
+
+        # releasing rolls back and hands the same connection out again
+        pool.release(first)
+        self.assertEqual(1, first.connection.rollbacks, 'test 5.6')
+        self.assertEqual({'idle': 1, 'in_use': 1}, {key: pool.stats()[key] for key in ('idle', 'in_use')}, 'test 5.7')
+        with pool.connection() as conn:
+            self.assertIs(first, conn, 'test 5.8')
+        self.assertEqual(2, first.connection.rollbacks, 'test 5.9')
+        self.assertEqual(2, len(self.connections), 'test 5.10')
+
+        # a connection closed while borrowed is discarded on release, freeing its slot
+        second.connection.close()
+        pool.release(second)
+        self.assertEqual({'size': 1, 'discarded': 1}, {key: pool.stats()[key] for key in ('size', 'discarded')},
+                         'test 5.11')
+
+        pool.close()
+        self.assertEqual(1, first.connection.closed, 'test 5.12')
+        with self.assertRaises(DatabaseException.ConnectionInvalid):
+            pool.acquire()
+
+    def test_config(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.mkdir(os.path.join(directory.name, 'Utility'))
+        with open(os.path.join(directory.name, 'Utility', 'database.ini'), 'w') as ini:
+            ini.write("[postgresql]\nhost=filehost\ndatabase=cs236\nuser=java\npassword=password\nport=5432\n")
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        self.addCleanup(Connector.reload_config, True)
+        Connector.reload_config(force=True)
+
+        with mock.patch.dict(os.environ, clear=False), \
+                mock.patch.object(Connector, 'ConfigParser', wraps=ConfigParser) as parser:
+            for env in Connector.CONFIG_ENV_OVERRIDES:
+                os.environ.pop(env, None)
+            self.assertEqual('filehost', Connector.load_config()['host'], 'test 6.1')
+            self.assertEqual(1, parser.call_count, 'test 6.2')
+
+            # the resolved parameters are cached until reload_config()
+            os.environ['PGHOST'] = 'envhost'
+            self.assertEqual('filehost', Connector.load_config()['host'], 'test 6.3')
+            Connector.reload_config()
+            config = Connector.load_config()
+            self.assertEqual('envhost', config['host'], 'test 6.4')
+            self.assertEqual('cs236', config['database'], 'test 6.5')
+            # the unchanged file was not parsed again
+            self.assertEqual(1, parser.call_count, 'test 6.6')
+
+            config['host'] = 'changed'
+            self.assertEqual('envhost', Connector.load_config()['host'], 'test 6.7')
+            Connector.reload_config(force=True)
+            Connector.load_config()
+            self.assertEqual(2, parser.call_count, 'test 6.8')
+
+    def test_result_set_rows(self) -> None:
+        placed = datetime(2024, 1, 1, 12)
+        rows = [(1, Decimal('9.5'), 'pizza', placed), (2, None, 'pasta', None)]
+        result = Connector.ResultSet(DESCRIPTION, rows)
+        row = result[0]
+        self.assertIsInstance(row, Connector.ResultSetRow, 'test 7.1')
+        self.assertEqual('pizza', row['name'], 'test 7.2')
+        self.assertEqual(Decimal('9.5'), row['PRICE'], 'test 7.3')
+        self.assertEqual(None, row[0], 'test 7.4')
+        self.assertEqual({'id': 1, 'price': Decimal('9.5'), 'name': 'pizza', 'placed': placed}, dict(row), 'test 7.5')
+        self.assertEqual(['pizza', 'pasta'], result['name'], 'test 7.6')
+        self.assertEqual([1, 2], [row['id'] for row in result], 'test 7.7')
+        self.assertEqual(None, result[1]['price'], 'test 7.8')
+        with self.assertRaises(KeyError):
+            row['missing']
+        with self.assertRaises(KeyError):
+            result['missing']
+
+        # the copying mode returns the same values as ResultSetDict rows
+        copied = Connector.ResultSet(DESCRIPTION, rows, lazy_rows=False)
+        self.assertIsInstance(copied[1], Connector.ResultSetDict, 'test 7.9')
+        self.assertEqual([dict(row) for row in result], [dict(row) for row in copied], 'test 7.10')
+        with self.assertRaises(KeyError):
+            copied[0]['missing']
+        self.assertEqual({}, result[2], 'test 7.11')
+
+        # an empty result gives [] for any column name, as the eager ResultSet did
+        self.assertEqual([], Connector.ResultSet(DESCRIPTION, [])['missing'], 'test 7.12')
+        self.assertEqual([], Connector.ResultSet(DESCRIPTION, [])['Name'], 'test 7.13')
+        self.assertEqual([], Connector.ResultSet()['name'], 'test 7.14')
+
+    def test_notification_listener(self) -> None:
+        # the fake connection is "readable" as soon as notifications were appended to it
+        def select(readable, writable, exceptional, timeout):
+            if readable[0].notifies:
+                return readable, [], []
+            time.sleep(timeout)
+            return [], [], []
+
+        received = []
+        delivered = threading.Event()
+        connected = threading.Event()
+
+        def callback(payload):
+            received.append(payload)
+            if len(received) == 2:
+                delivered.set()
+
+        with mock.patch.object(Connector.select, 'select', side_effect=select):
+            listener = Connector.NotificationListener('cache_invalidation', callback, on_connect=connected.set,
+                                                      poll_timeout=0.01)
+            listener.start()
+            self.assertTrue(connected.wait(1), 'test 8.1')
+            connection = self.connections[0]
+            self.assertEqual(True, connection.autocommit, 'test 8.2')
+            self.assertEqual(1, len(connection.executed), 'test 8.3')
+
+            connection.notifies.extend([Notify(1, 'cache_invalidation', 'Dish:1'),
+                                        Notify(1, 'cache_invalidation', 'Customer:2')])
+            self.assertTrue(delivered.wait(1), 'test 8.4')
+            self.assertEqual(['Dish:1', 'Customer:2'], received, 'test 8.5')
+            self.assertEqual([], connection.notifies, 'test 8.6')
+
+            # after stop() the connection is closed and nothing is dispatched any more
+            listener.stop(timeout=1)
+            self.assertEqual(False, listener.is_running(), 'test 8.7')
+            self.assertEqual(1, connection.closed, 'test 8.8')
+            connection.notifies.append(Notify(1, 'cache_invalidation', 'Dish:3'))
+            time.sleep(0.05)
+            self.assertEqual(['Dish:1', 'Customer:2'], received, 'test 8.9')
+            self.assertEqual({'notifications': 2, 'connects': 1, 'errors': 0}, listener.stats(), 'test 8.10')
+            self.assertEqual(1, len(self.connections), 'test 8.11')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
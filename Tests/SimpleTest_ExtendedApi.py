@@ -0,0 +1,615 @@
+import asyncio
+import random
+import threading
+import time
+import unittest
+from datetime import date, datetime
+
+from psycopg2 import sql
+
+import Solution as Solution
+import SolutionAio as SolutionAio
+import Utility.DBConnector as Connector
+from Business.Dish import Dish, BadDish
+from Business.Order import Order, BadOrder
+from Business.OrderDish import OrderDish
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+from Business.Customer import Customer, BadCustomer
+
+'''
+    Tests for the API added on top of the homework functions
+    make sure the tests' names start with test
+'''
+
+
+class Test(AbstractTest):
+    def test_bulk_add_customers(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 1.1')
+        customers = [Customer(2, 'name', 21, "0123456789"),
+                     Customer(1, 'name', 21, "0123456789"),   # already in the table
+                     Customer(3, 'name', 17, "0123456789"),   # age < 18
+                     Customer(4, None, 21, "0123456789"),     # full_name is NULL
+                     Customer(2, 'other', 30, "9876543210"),  # duplicate inside the batch
+                     Customer(5, 'name', 21, "0123456789")]
+        expected = [ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.BAD_PARAMS,
+                    ReturnValue.BAD_PARAMS, ReturnValue.ALREADY_EXISTS, ReturnValue.OK]
+        self.assertEqual(expected, Solution.add_customers(customers), 'test 1.2')
+        self.assertEqual(Customer(2, 'name', 21, "0123456789"), Solution.get_customer(2), 'test 1.3')
+        self.assertEqual(BadCustomer(), Solution.get_customer(3), 'test 1.4')
+        self.assertEqual([], Solution.add_customers([]), 'test 1.5')
+
+    def test_bulk_add_orders_and_dishes(self) -> None:
+        orders = [Order(1, datetime(2024, 1, 1, 12), 10, "address 1"),
+                  Order(2, datetime(2024, 1, 1, 12), 0, "address 2"),    # delivery_fee <= 0
+                  Order(3, datetime(2024, 1, 1, 12), 10, "addr"),        # address too short
+                  Order(1, datetime(2024, 1, 1, 12), 10, "address 1")]
+        expected = [ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS, ReturnValue.ALREADY_EXISTS]
+        self.assertEqual(expected, Solution.add_orders(iter(orders)), 'test 2.1')
+        self.assertEqual(orders[0], Solution.get_order(1), 'test 2.2')
+
+        dishes = [Dish(1, 'pizza', 40, True), Dish(2, 'pho', 40, True), Dish(3, 'pasta', -1, True),
+                  Dish(4, 'salad', 20, None), Dish(1, 'pizza', 40, True)]
+        expected = [ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS,
+                    ReturnValue.BAD_PARAMS, ReturnValue.ALREADY_EXISTS]
+        self.assertEqual(expected, Solution.add_dishes(dishes), 'test 2.3')
+        self.assertEqual(Dish(1, 'pizza', 40, True), Solution.get_dish(1), 'test 2.4')
+        self.assertEqual(BadDish(), Solution.get_dish(2), 'test 2.5')
+
+    def test_ingest_order_items(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(1, datetime(2024, 1, 1, 12), 10, "address 1")), 'test 3.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 3.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(2, 'pasta', 30, False)), 'test 3.3')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(3, 'salad', 20, True)), 'test 3.4')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 3, 1), 'test 3.5')
+        items = ((order_id, dish_id, amount) for order_id, dish_id, amount in
+                 [(1, 1, 2), (1, 2, 1), (1, 3, 4), (2, 1, 1), (1, 1, 5), (1, 4, 1)])
+        expected = [(1, (1, 2, 1), ReturnValue.NOT_EXISTS),      # inactive dish
+                    (2, (1, 3, 4), ReturnValue.ALREADY_EXISTS),  # already in the order
+                    (3, (2, 1, 1), ReturnValue.NOT_EXISTS),      # missing order
+                    (4, (1, 1, 5), ReturnValue.ALREADY_EXISTS),  # duplicate inside the stream
+                    (5, (1, 4, 1), ReturnValue.NOT_EXISTS)]      # missing dish
+        self.assertEqual(expected, Solution.ingest_order_items(items, chunk_size=2), 'test 3.6')
+        self.assertEqual([OrderDish(1, 2, 40), OrderDish(3, 1, 20)], Solution.get_all_order_items(1), 'test 3.7')
+        # amount <= 0 is reported before the duplicate, as the CHECK constraint fires first
+        self.assertEqual([(0, (1, 3, 0), ReturnValue.BAD_PARAMS)], Solution.ingest_order_items([(1, 3, 0)]), 'test 3.8')
+
+    def test_transaction(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 4.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 4.2')
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK,
+                             Solution.add_order(Order(1, datetime(2024, 1, 1, 12), 10, "address 1")), 'test 4.3')
+            self.assertEqual(ReturnValue.OK, Solution.customer_placed_order(1, 1), 'test 4.4')
+            # a failing call keeps its ReturnValue and does not abort the transaction
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.customer_placed_order(1, 1), 'test 4.5')
+            self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 1, 2), 'test 4.6')
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.order_contains_dish(1, 1, 3), 'test 4.7')
+            self.assertEqual(ReturnValue.NOT_EXISTS, Solution.order_contains_dish(1, 5, 3), 'test 4.7.1')
+        self.assertEqual(Customer(1, 'name', 21, "0123456789"), Solution.get_customer_that_placed_order(1), 'test 4.8')
+        self.assertEqual([OrderDish(1, 2, 40)], Solution.get_all_order_items(1), 'test 4.9')
+
+        # an exception escaping the block rolls back every call made inside it
+        with self.assertRaises(RuntimeError):
+            with Solution.transaction():
+                self.assertEqual(ReturnValue.OK,
+                                 Solution.add_order(Order(2, datetime(2024, 1, 1, 12), 10, "address 2")), 'test 4.10')
+                raise RuntimeError('abort checkout')
+        self.assertEqual(BadOrder(), Solution.get_order(2), 'test 4.11')
+
+    def test_orders_sum_maintenance(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(1, datetime(2024, 1, 1, 12), 10, "address 1")), 'test 5.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(2, datetime(2024, 1, 1, 12), 5, "address 2")), 'test 5.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 5.3')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(2, 'pasta', 30, True)), 'test 5.4')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 1, 2), 'test 5.5')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 2, 1), 'test 5.6')
+        self.assertEqual(120.0, Solution.get_order_total_price(1), 'test 5.7')
+        self.assertEqual(5.0, Solution.get_order_total_price(2), 'test 5.8')
+        self.assertEqual(ReturnValue.OK, Solution.order_does_not_contain_dish(1, 1), 'test 5.9')
+        self.assertEqual(40.0, Solution.get_order_total_price(1), 'test 5.10')
+        self.assertEqual([], Solution.check_orders_sum_consistency(), 'test 5.11')
+        self.assertEqual(ReturnValue.OK, Solution.delete_order(1), 'test 5.12')
+        self.assertEqual([], Solution.check_orders_sum_consistency(), 'test 5.13')
+
+    def test_similarity_components(self) -> None:
+        for cust_id in range(1, 5):
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(cust_id, 'name', 21, "0123456789")), 'test 6.1')
+        for dish_id in range(1, 5):
+            self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(dish_id, f'dish {dish_id}', 10, True)), 'test 6.2')
+        # 1 ~ 2 through dish 1, 2 ~ 3 through dish 2, customer 4 only has a low rating
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(1, 1, 5), 'test 6.3')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 1, 4), 'test 6.4')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 2, 4), 'test 6.5')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(3, 2, 5), 'test 6.6')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(3, 3, 5), 'test 6.7')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(4, 3, 1), 'test 6.8')
+        self.assertEqual([1, 2, 3], Solution.get_potential_dish_recommendations(1), 'test 6.9')
+        self.assertEqual([], Solution.get_potential_dish_recommendations(4), 'test 6.10')
+
+        # removing the link through dish 2 splits the component
+        self.assertEqual(ReturnValue.OK, Solution.customer_deleted_rating_on_dish(2, 2), 'test 6.11')
+        self.assertEqual([1], Solution.get_potential_dish_recommendations(2), 'test 6.12')
+        self.assertEqual([], Solution.get_potential_dish_recommendations(3), 'test 6.13')
+
+        # deleting a customer splits it too
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 2, 4), 'test 6.14')
+        self.assertEqual(ReturnValue.OK, Solution.delete_customer(2), 'test 6.15')
+        self.assertEqual([], Solution.get_potential_dish_recommendations(1), 'test 6.16')
+        self.assertEqual(ReturnValue.OK, Solution.rebuild_similarity(), 'test 6.17')
+        self.assertEqual([], Solution.get_potential_dish_recommendations(3), 'test 6.18')
+
+    def test_export_iterators(self) -> None:
+        orders = [Order(order_id, datetime(2024, 1, order_id, 12), 10, f"address {order_id}") for order_id in range(1, 6)]
+        self.assertEqual([ReturnValue.OK] * 5, Solution.add_orders(orders), 'test 7.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 7.2')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(2, 1, 3), 'test 7.3')
+        self.assertEqual(orders, list(Solution.iter_all_orders(itersize=2)), 'test 7.4')
+        self.assertEqual([(2, OrderDish(1, 3, 40))], list(Solution.iter_all_order_items()), 'test 7.5')
+        self.assertEqual([], list(Solution.iter_all_ratings()), 'test 7.6')
+
+    def test_batched_getters(self) -> None:
+        c1, c2 = Customer(1, 'name', 21, "0123456789"), Customer(2, 'other', 30, "9876543210")
+        self.assertEqual([ReturnValue.OK, ReturnValue.OK], Solution.add_customers([c1, c2]), 'test 8.1')
+        o1, o2 = Order(1, datetime(2024, 1, 1, 12), 10, "address 1"), Order(2, datetime(2024, 1, 2, 12), 5, "address 2")
+        self.assertEqual([ReturnValue.OK, ReturnValue.OK], Solution.add_orders([o1, o2]), 'test 8.2')
+        d1 = Dish(1, 'pizza', 40, True)
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(d1), 'test 8.3')
+        self.assertEqual(ReturnValue.OK, Solution.customer_placed_order(2, 1), 'test 8.4')
+
+        self.assertEqual([c2, BadCustomer(), c1, c2], Solution.get_customers([2, 3, 1, 2]), 'test 8.5')
+        self.assertEqual([o2, BadOrder(), o1], Solution.get_orders([2, 7, 1]), 'test 8.6')
+        self.assertEqual([BadDish(), d1], Solution.get_dishes([2, 1]), 'test 8.7')
+        self.assertEqual([c2, BadCustomer(), BadCustomer()],
+                         Solution.get_customers_that_placed_orders([1, 2, 3]), 'test 8.8')
+        self.assertEqual([], Solution.get_customers([]), 'test 8.9')
+
+    def test_read_through_cache(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 9.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 9.2')
+        hits = Solution.cache_stats()['dish']['hits']
+        self.assertEqual(Dish(1, 'pizza', 40, True), Solution.get_dish(1), 'test 9.3')
+        self.assertEqual(Dish(1, 'pizza', 40, True), Solution.get_dish(1), 'test 9.4')
+        self.assertEqual(hits + 1, Solution.cache_stats()['dish']['hits'], 'test 9.5')
+
+        self.assertEqual(ReturnValue.OK, Solution.update_dish_price(1, 50), 'test 9.6')
+        self.assertEqual(Dish(1, 'pizza', 50, True), Solution.get_dish(1), 'test 9.7')
+        self.assertEqual(ReturnValue.OK, Solution.update_dish_active_status(1, False), 'test 9.8')
+        self.assertEqual(Dish(1, 'pizza', 50, False), Solution.get_dish(1), 'test 9.9')
+
+        self.assertEqual(Customer(1, 'name', 21, "0123456789"), Solution.get_customer(1), 'test 9.10')
+        self.assertEqual(ReturnValue.OK, Solution.delete_customer(1), 'test 9.11')
+        self.assertEqual(BadCustomer(), Solution.get_customer(1), 'test 9.12')
+
+        Solution.clear_tables()
+        self.assertEqual(BadDish(), Solution.get_dish(1), 'test 9.13')
+
+    def test_cross_connection_invalidation(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 9.14')
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 9.15')
+
+        # polls fn until it returns expected, gives up after 10 seconds
+        def eventually(fn, expected):
+            deadline = time.monotonic() + 10
+            while fn() != expected and time.monotonic() < deadline:
+                time.sleep(0.05)
+            return fn()
+
+        Solution.configure_caches(result_size=16)
+        Solution.start_cache_invalidation_listener()
+        try:
+            # the caches are emptied when the listener connects, so they are filled only after that
+            connected = eventually(lambda: Solution.cache_invalidation_stats()['connects'] > 0, True)
+            self.assertEqual(True, connected, 'test 9.16')
+            connects = Solution.cache_invalidation_stats()['connects']
+            self.assertEqual(Dish(1, 'pizza', 40, True), Solution.get_dish(1), 'test 9.17')
+            self.assertEqual(Customer(1, 'name', 21, "0123456789"), Solution.get_customer(1), 'test 9.18')
+            self.assertEqual([], Solution.get_customers_rated_but_not_ordered(), 'test 9.19')
+            notifications = Solution.cache_invalidation_stats()['notifications']
+
+            # another process writes through its own connection, bypassing this process' invalidation
+            other = Connector.DBConnector()
+            try:
+                other.execute("UPDATE Dish SET price = 50 WHERE dish_id = 1")
+                other.execute("UPDATE Customer SET full_name = 'other' WHERE cust_id = 1")
+                other.execute("INSERT INTO DishRatings(cust_id, dish_id, rating) VALUES (1, 1, 1)")
+                other.commit()
+            finally:
+                other.close()
+
+            self.assertEqual(Dish(1, 'pizza', 50, True), eventually(lambda: Solution.get_dish(1),
+                                                                    Dish(1, 'pizza', 50, True)), 'test 9.20')
+            self.assertEqual(Customer(1, 'other', 21, "0123456789"),
+                             eventually(lambda: Solution.get_customer(1), Customer(1, 'other', 21, "0123456789")),
+                             'test 9.21')
+            self.assertEqual([1], eventually(Solution.get_customers_rated_but_not_ordered, [1]), 'test 9.22')
+            # no reconnect emptied the caches in between, the notifications did
+            self.assertEqual(connects, Solution.cache_invalidation_stats()['connects'], 'test 9.23')
+            self.assertLess(notifications, Solution.cache_invalidation_stats()['notifications'], 'test 9.24')
+        finally:
+            Solution.stop_cache_invalidation_listener()
+            Solution.configure_caches()
+
+    def test_async_api(self) -> None:
+        async def scenario():
+            results = await asyncio.gather(*(SolutionAio.add_dish(Dish(dish_id, f'dish {dish_id}', 10 * dish_id, True))
+                                             for dish_id in range(1, 21)))
+            self.assertEqual([ReturnValue.OK] * 20, results, 'test 10.1')
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, await SolutionAio.add_dish(Dish(1, 'pizza', 10, True)),
+                             'test 10.2')
+            self.assertEqual(ReturnValue.OK, await SolutionAio.add_order(Order(1, datetime(2024, 1, 1), 5, 'address')),
+                             'test 10.3')
+            results = await asyncio.gather(*(SolutionAio.order_contains_dish(1, dish_id, 1) for dish_id in range(1, 22)))
+            self.assertEqual([ReturnValue.OK] * 20 + [ReturnValue.NOT_EXISTS], results, 'test 10.4')
+            self.assertEqual(2105, await SolutionAio.get_order_total_price(1), 'test 10.5')
+            self.assertEqual(Dish(3, 'dish 3', 30, True), await SolutionAio.get_dish(3), 'test 10.6')
+
+            def failing_order():
+                Solution.add_order(Order(2, datetime(2024, 1, 2), 5, 'address'))
+                raise RuntimeError('abort')
+
+            with self.assertRaises(RuntimeError):
+                await SolutionAio.run_in_transaction(failing_order)
+            self.assertEqual(BadOrder(), await SolutionAio.get_order(2), 'test 10.7')
+
+        asyncio.run(scenario())
+
+        # more calls in flight than the default pool holds
+        SolutionAio.configure(max_concurrency=30)
+        try:
+            self.assertEqual(30, Solution.Connector.pool_max_size(), 'test 10.8')
+
+            async def many_calls():
+                return await asyncio.gather(*(SolutionAio.get_dish(dish_id % 20 + 1) for dish_id in range(200)))
+
+            self.assertEqual([Dish(dish_id % 20 + 1, f'dish {dish_id % 20 + 1}', 10 * (dish_id % 20 + 1), True)
+                              for dish_id in range(200)], asyncio.run(many_calls()), 'test 10.9')
+        finally:
+            SolutionAio.configure()
+
+    def test_pipeline(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 11.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 10, True)), 'test 11.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(2, 'pasta', 20, False)), 'test 11.3')
+        results = Solution.pipeline([
+            ('add_order', (Order(1, datetime(2024, 1, 1), 5, 'address'),)),
+            ('add_order', (Order(1, datetime(2024, 1, 1), 5, 'address'),)),
+            ('add_order', (Order(2, datetime(2024, 1, 1), -5, 'address'),)),
+            ('customer_placed_order', (1, 1)),
+            ('customer_placed_order', (2, 1)),
+            ('order_contains_dish', (1, 1, 3)),
+            ('order_contains_dish', (1, 1, 3)),
+            ('order_contains_dish', (1, 2, 3)),
+            ('order_contains_dish', (1, 1, 0)),
+            ('order_contains_dish', (3, 1, 1)),
+            ('customer_rated_dish', (1, 1, 5)),
+            ('customer_rated_dish', (1, 1, 6)),
+            ('order_does_not_contain_dish', (1, 2)),
+            ('customer_deleted_rating_on_dish', (1, 2)),
+            ('delete_order', (2,)),
+        ])
+        self.assertEqual([ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.BAD_PARAMS,
+                          ReturnValue.OK, ReturnValue.ALREADY_EXISTS,
+                          ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.NOT_EXISTS, ReturnValue.BAD_PARAMS,
+                          ReturnValue.NOT_EXISTS,
+                          ReturnValue.OK, ReturnValue.BAD_PARAMS,
+                          ReturnValue.NOT_EXISTS, ReturnValue.NOT_EXISTS, ReturnValue.NOT_EXISTS], results, 'test 11.4')
+        self.assertEqual(Customer(1, 'name', 21, "0123456789"), Solution.get_customer_that_placed_order(1), 'test 11.5')
+        self.assertEqual([OrderDish(1, 3, 10)], Solution.get_all_order_items(1), 'test 11.6')
+        self.assertEqual([(1, 5)], Solution.get_all_customer_ratings(1), 'test 11.7')
+        self.assertEqual(35, Solution.get_order_total_price(1), 'test 11.8')
+        self.assertEqual([], Solution.pipeline([]), 'test 11.9')
+
+    def test_place_order(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 12.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 10, True)), 'test 12.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(2, 'pasta', 20, True)), 'test 12.3')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(3, 'salad', 30, False)), 'test 12.4')
+
+        order = Order(1, datetime(2024, 1, 1), 5, 'address')
+        items = [(1, 2), (3, 1), (4, 1), (2, 0), (2, 1), (1, 3), (None, 1), (2, None)]
+        self.assertEqual((ReturnValue.OK, [ReturnValue.OK, ReturnValue.NOT_EXISTS, ReturnValue.NOT_EXISTS,
+                                           ReturnValue.BAD_PARAMS, ReturnValue.OK, ReturnValue.ALREADY_EXISTS,
+                                           ReturnValue.NOT_EXISTS, ReturnValue.NOT_EXISTS]),
+                         Solution.place_order(order, 1, items), 'test 12.5')
+        self.assertEqual(order, Solution.get_order(1), 'test 12.6')
+        self.assertEqual(Customer(1, 'name', 21, "0123456789"), Solution.get_customer_that_placed_order(1), 'test 12.7')
+        self.assertEqual([OrderDish(1, 2, 10), OrderDish(2, 1, 20)], Solution.get_all_order_items(1), 'test 12.8')
+        self.assertEqual(45, Solution.get_order_total_price(1), 'test 12.9')
+
+        # order level failures write nothing
+        self.assertEqual((ReturnValue.ALREADY_EXISTS, [ReturnValue.ALREADY_EXISTS]),
+                         Solution.place_order(order, 1, [(2, 1)]), 'test 12.10')
+        self.assertEqual((ReturnValue.NOT_EXISTS, [ReturnValue.NOT_EXISTS]),
+                         Solution.place_order(Order(2, datetime(2024, 1, 1), 5, 'address'), 2, [(1, 1)]), 'test 12.11')
+        self.assertEqual(BadOrder(), Solution.get_order(2), 'test 12.12')
+        self.assertEqual((ReturnValue.BAD_PARAMS, []),
+                         Solution.place_order(Order(3, datetime(2024, 1, 1), -1, 'address'), None, []), 'test 12.13')
+
+        self.assertEqual((ReturnValue.OK, [ReturnValue.OK]),
+                         Solution.place_order(Order(4, datetime(2024, 1, 1), 5, 'address'), None, [(1, 1)]),
+                         'test 12.14')
+        self.assertEqual(BadCustomer(), Solution.get_customer_that_placed_order(4), 'test 12.15')
+        self.assertEqual(15, Solution.get_order_total_price(4), 'test 12.16')
+
+    def test_result_cache(self) -> None:
+        Solution.configure_caches(result_size=16)
+        try:
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'name', 21, "0123456789")), 'test 13.1')
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(2, 'name', 21, "0123456789")), 'test 13.2')
+            self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 10, True)), 'test 13.3')
+            self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(1, 1, 1), 'test 13.4')
+            hits = Solution.cache_stats()['result']['hits']
+            self.assertEqual([1], Solution.get_customers_rated_but_not_ordered(), 'test 13.5')
+            self.assertEqual([1], Solution.get_customers_rated_but_not_ordered(), 'test 13.6')
+            self.assertEqual(hits + 1, Solution.cache_stats()['result']['hits'], 'test 13.7')
+
+            self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 1, 2), 'test 13.8')
+            self.assertEqual([1, 2], Solution.get_customers_rated_but_not_ordered(), 'test 13.9')
+
+            self.assertEqual(ReturnValue.OK, Solution.add_order(Order(1, datetime(2024, 1, 1), 5, 'address')),
+                             'test 13.10')
+            self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 1, 1), 'test 13.11')
+            self.assertEqual([1, 2], Solution.get_customers_rated_but_not_ordered(), 'test 13.12')
+            self.assertEqual(ReturnValue.OK, Solution.customer_placed_order(1, 1), 'test 13.13')
+            self.assertEqual([2], Solution.get_customers_rated_but_not_ordered(), 'test 13.14')
+
+            self.assertEqual(ReturnValue.OK, Solution.delete_order(1), 'test 13.15')
+            self.assertEqual([1, 2], Solution.get_customers_rated_but_not_ordered(), 'test 13.16')
+            self.assertEqual(ReturnValue.OK, Solution.customer_deleted_rating_on_dish(2, 1), 'test 13.17')
+            self.assertEqual([1], Solution.get_customers_rated_but_not_ordered(), 'test 13.18')
+        finally:
+            Solution.configure_caches()
+
+    def test_dish_price_history(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 10, True)), 'test 14.1')
+        self.assertEqual(ReturnValue.OK, Solution.update_dish_price(1, 10), 'test 14.2')
+        self.assertEqual(ReturnValue.OK, Solution.update_dish_price(1, 20), 'test 14.3')
+        self.assertEqual([10, 20], [price for _, price in Solution.get_dish_price_history(1)], 'test 14.4')
+        self.assertEqual([], Solution.get_dish_price_history(2), 'test 14.5')
+
+        for order_id in range(1, 4):
+            self.assertEqual(ReturnValue.OK, Solution.add_order(Order(order_id, datetime(2024, 1, order_id), 5, 'address')),
+                             'test 14.6')
+        self.assertEqual(ReturnValue.OK, Solution.update_dish_price(1, 10), 'test 14.7')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 1, 4), 'test 14.8')
+        self.assertEqual(ReturnValue.OK, Solution.update_dish_price(1, 15), 'test 14.9')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(2, 1, 2), 'test 14.10')
+        # 15 * 2 < 10 * 4
+        self.assertEqual([1], Solution.get_non_worth_price_increase(), 'test 14.11')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(3, 1, 4), 'test 14.12')
+        self.assertEqual([], Solution.get_non_worth_price_increase(), 'test 14.13')
+        self.assertEqual(ReturnValue.OK, Solution.order_does_not_contain_dish(3, 1), 'test 14.14')
+        self.assertEqual([1], Solution.get_non_worth_price_increase(), 'test 14.15')
+        self.assertEqual(ReturnValue.OK, Solution.delete_order(1), 'test 14.16')
+        self.assertEqual([], Solution.get_non_worth_price_increase(), 'test 14.17')
+        self.assertEqual(ReturnValue.OK, Solution.rebuild_dish_price_stats(), 'test 14.18')
+        self.assertEqual([], Solution.get_non_worth_price_increase(), 'test 14.19')
+
+    def test_monthly_revenue(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 10, True)), 'test 15.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(1, datetime(2024, 2, 10), 5, 'address')), 'test 15.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(2, datetime(2024, 5, 1), 3, 'address')), 'test 15.3')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(3, datetime(2023, 5, 1), 7, 'address')), 'test 15.4')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 1, 2), 'test 15.5')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(2, 1, 1), 'test 15.6')
+        expected = [(month, 0.0 if month < 2 else 25.0 if month < 5 else 38.0) for month in range(12, 0, -1)]
+        self.assertEqual(expected, Solution.get_cumulative_profit_per_month(2024), 'test 15.7')
+        self.assertEqual([(month, 0.0 if month < 5 else 7.0) for month in range(12, 0, -1)],
+                         Solution.get_cumulative_profit_per_month(2023), 'test 15.8')
+
+        self.assertEqual(ReturnValue.OK, Solution.order_does_not_contain_dish(1, 1), 'test 15.9')
+        expected = [(month, 0.0 if month < 2 else 5.0 if month < 5 else 18.0) for month in range(12, 0, -1)]
+        self.assertEqual(expected, Solution.get_cumulative_profit_per_month(2024), 'test 15.10')
+        self.assertEqual(ReturnValue.OK, Solution.delete_order(2), 'test 15.11')
+        expected = [(month, 0.0 if month < 2 else 5.0) for month in range(12, 0, -1)]
+        self.assertEqual(expected, Solution.get_cumulative_profit_per_month(2024), 'test 15.12')
+        self.assertEqual(ReturnValue.OK, Solution.rebuild_monthly_revenue(), 'test 15.13')
+        self.assertEqual(expected, Solution.get_cumulative_profit_per_month(2024), 'test 15.14')
+        self.assertEqual([(month, 0.0) for month in range(12, 0, -1)], Solution.get_cumulative_profit_per_month(2025),
+                         'test 15.15')
+
+    def test_cumulative_profit_range(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 10, True)), 'test 16.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(1, datetime(2023, 12, 31, 23), 5, 'address')),
+                         'test 16.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(2, datetime(2024, 1, 2, 8), 3, 'address')),
+                         'test 16.3')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(3, datetime(2024, 1, 3, 12), 2, 'address')),
+                         'test 16.4')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(2, 1, 1), 'test 16.5')
+
+        profit = Solution.get_cumulative_profit(date(2023, 12, 1), date(2024, 2, 29), 'month')
+        self.assertEqual([date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)], profit.buckets, 'test 16.6')
+        self.assertEqual([5.0, 15.0, 0.0], list(profit.revenue), 'test 16.7')
+        self.assertEqual([5.0, 20.0, 20.0], list(profit.cumulative), 'test 16.8')
+
+        # not whole months: the orders of the range only
+        profit = Solution.get_cumulative_profit(date(2024, 1, 2), date(2024, 1, 31), 'month')
+        self.assertEqual([date(2024, 1, 1)], profit.buckets, 'test 16.9')
+        self.assertEqual([15.0], list(profit.cumulative), 'test 16.10')
+
+        profit = Solution.get_cumulative_profit(date(2023, 12, 31), date(2024, 1, 3), 'day')
+        self.assertEqual([date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)], profit.buckets,
+                         'test 16.11')
+        self.assertEqual([5.0, 0.0, 13.0, 2.0], list(profit.revenue), 'test 16.12')
+        self.assertEqual([5.0, 5.0, 18.0, 20.0], list(profit.cumulative), 'test 16.13')
+
+        profit = Solution.get_cumulative_profit(date(2023, 12, 31), date(2024, 1, 3), 'week')
+        self.assertEqual([date(2023, 12, 25), date(2024, 1, 1)], profit.buckets, 'test 16.14')
+        self.assertEqual([5.0, 15.0], list(profit.revenue), 'test 16.15')
+
+        self.assertEqual([], Solution.get_cumulative_profit(date(2024, 2, 1), date(2024, 1, 1), 'day').buckets,
+                         'test 16.16')
+        with self.assertRaises(ValueError):
+            Solution.get_cumulative_profit(date(2024, 1, 1), date(2024, 2, 1), 'year')
+        self.assertEqual([(month, 15.0) for month in range(12, 0, -1)], Solution.get_cumulative_profit_per_month(2024),
+                         'test 16.17')
+        # years outside the ones of datetime have no orders, as before get_cumulative_profit
+        zeros = [(month, 0.0) for month in range(12, 0, -1)]
+        self.assertEqual(zeros, Solution.get_cumulative_profit_per_month(0), 'test 16.18')
+        self.assertEqual(zeros, Solution.get_cumulative_profit_per_month(-2024), 'test 16.19')
+        self.assertEqual(zeros, Solution.get_cumulative_profit_per_month(10000), 'test 16.20')
+        self.assertEqual(zeros, Solution.get_cumulative_profit_per_month(9999), 'test 16.21')
+
+    def test_top_rated_dishes_bitmap(self) -> None:
+        for cust_id in range(1, 4):
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(cust_id, 'name', 21, "0123456789")),
+                             'test 17.1')
+        for dish_id in range(1, 8):
+            self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(dish_id, f'dish {dish_id}', 10, True)),
+                             'test 17.2')
+        # top 5: dishes 1..5, dish 6 is rated below them
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(3, 6, 1), 'test 17.3')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(1, datetime(2024, 1, 1), 5, 'address')), 'test 17.4')
+        self.assertEqual(ReturnValue.OK, Solution.customer_placed_order(1, 1), 'test 17.5')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(1, 2, 1), 'test 17.6')
+        self.assertEqual(ReturnValue.OK, Solution.add_order(Order(2, datetime(2024, 1, 1), 5, 'address')), 'test 17.7')
+        self.assertEqual(ReturnValue.OK, Solution.customer_placed_order(2, 2), 'test 17.8')
+        self.assertEqual(ReturnValue.OK, Solution.order_contains_dish(2, 6, 1), 'test 17.9')
+
+        expected = [True, False, False, False]
+        self.assertEqual(expected, Solution.did_customers_order_top_rated_dishes([1, 2, 3, 4]), 'test 17.10')
+
+        Solution.configure_caches(result_size=16)
+        try:
+            self.assertEqual(expected, Solution.did_customers_order_top_rated_dishes([1, 2, 3, 4]), 'test 17.11')
+            self.assertEqual(expected, [Solution.did_customer_order_top_rated_dishes(cust_id) for cust_id in range(1, 5)],
+                             'test 17.12')
+            # customer 2's dish 6 becomes the best rated dish
+            self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(1, 6, 5), 'test 17.13')
+            self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 6, 5), 'test 17.14')
+            self.assertEqual(True, Solution.did_customer_order_top_rated_dishes(2), 'test 17.15')
+            self.assertEqual([True, True, False], Solution.did_customers_order_top_rated_dishes([1, 2, 3]), 'test 17.16')
+            self.assertEqual(ReturnValue.OK, Solution.order_does_not_contain_dish(1, 2), 'test 17.17')
+            self.assertEqual([False, True, False], Solution.did_customers_order_top_rated_dishes([1, 2, 3]),
+                             'test 17.18')
+            self.assertEqual(False, Solution.did_customer_order_top_rated_dishes(1), 'test 17.19')
+        finally:
+            Solution.configure_caches()
+        self.assertEqual(True, Solution.did_customer_order_top_rated_dishes(2), 'test 17.20')
+
+    def test_similarity_concurrent_writers(self) -> None:
+        for cust_id in range(1, 16):
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(cust_id, 'name', 21, "0123456789")),
+                             'test 18.1')
+        for dish_id in range(1, 13):
+            self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(dish_id, f'dish {dish_id}', 10, True)),
+                             'test 18.2')
+
+        for seed in range(10, 30):
+            rng = random.Random(seed)
+            pairs = rng.sample([(cust_id, dish_id) for cust_id in range(1, 16) for dish_id in range(1, 13)], 60)
+            ratings = [(cust_id, dish_id, rng.choice([2, 4, 5])) for cust_id, dish_id in pairs]
+            errors = []
+
+            # every writer rates its own share of the pairs and deletes a few of them again, so the triggers of
+            # different writers merge and split the same components at the same time
+            def writer(share):
+                for cust_id, dish_id, rating in share:
+                    if ReturnValue.OK != Solution.customer_rated_dish(cust_id, dish_id, rating):
+                        errors.append((cust_id, dish_id))
+                for cust_id, dish_id, _ in share[::4]:
+                    if ReturnValue.OK != Solution.customer_deleted_rating_on_dish(cust_id, dish_id):
+                        errors.append((cust_id, dish_id))
+
+            writers = [threading.Thread(target=writer, args=(ratings[i::6],)) for i in range(6)]
+            for thread in writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            self.assertEqual([], errors, f'test 18.3 (seed {seed})')
+
+            maintained = [Solution.get_potential_dish_recommendations(cust_id) for cust_id in range(1, 16)]
+            self.assertEqual(ReturnValue.OK, Solution.rebuild_similarity(), f'test 18.4 (seed {seed})')
+            rebuilt = [Solution.get_potential_dish_recommendations(cust_id) for cust_id in range(1, 16)]
+            self.assertEqual(rebuilt, maintained, f'test 18.5 (seed {seed})')
+
+            for cust_id, dish_id, _ in ratings:
+                Solution.customer_deleted_rating_on_dish(cust_id, dish_id)
+
+    def test_rating_score_maintenance(self) -> None:
+        for cust_id in range(1, 4):
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(cust_id, 'name', 21, "0123456789")),
+                             'test 19.1')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(1, 'pizza', 40, True)), 'test 19.2')
+        self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(2, 'pasta', 30, True)), 'test 19.3')
+        self.assertEqual([], Solution.check_rating_score_consistency(), 'test 19.4')
+
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(1, 1, 5), 'test 19.5')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 1, 2), 'test 19.6')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(2, 2, 4), 'test 19.7')
+        self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(3, 2, 1), 'test 19.8')
+        self.assertEqual([], Solution.check_rating_score_consistency(), 'test 19.9')
+
+        # there is no API updating a rating, so a single statement updates both ratings of customer 2
+        qstatus, rows, _, _ = Solution.handle_query(sql.SQL("UPDATE DishRatings SET rating = 3 WHERE cust_id = 2"))
+        self.assertEqual((ReturnValue.OK, 2), (qstatus, rows), 'test 19.10')
+        self.assertEqual([], Solution.check_rating_score_consistency(), 'test 19.11')
+
+        self.assertEqual(ReturnValue.OK, Solution.customer_deleted_rating_on_dish(1, 1), 'test 19.12')
+        self.assertEqual([], Solution.check_rating_score_consistency(), 'test 19.13')
+
+        # the cascade deletes both ratings of customer 2
+        self.assertEqual(ReturnValue.OK, Solution.delete_customer(2), 'test 19.14')
+        self.assertEqual([], Solution.check_rating_score_consistency(), 'test 19.15')
+        self.assertEqual([(2, 1)], Solution.get_all_customer_ratings(3), 'test 19.16')
+
+    def test_bulk_matches_single_row(self) -> None:
+        customers = [Customer(1, 'name', 21, "0123456789"),
+                     Customer(2, 'name', 21, "01234567890"),  # phone longer than VARCHAR(10)
+                     Customer(3, 'name', 21, "012345678"),    # phone shorter than 10
+                     Customer(4, 'name', '25', "0123456789"), # age cast by the database
+                     Customer(5, 'name', 18, "0123456789"),
+                     Customer(6, 'name', 120, "0123456789"),
+                     Customer(7, 'name', 121, "0123456789"),
+                     Customer(8, 'name', 'old', "0123456789"),
+                     Customer(0, 'name', 21, "0123456789"),
+                     Customer(1, 'name', 17, "0123456789"),   # duplicate key and a bad age
+                     Customer(1, 'name', 30, "0123456789")]
+        orders = [Order(1, datetime(2024, 1, 1, 12), 10, "addre"),
+                  Order(2, datetime(2024, 1, 1, 12), 10, "addr"),
+                  Order(3, datetime(2024, 1, 1, 12), 0.01, "address"),
+                  Order(4, datetime(2024, 1, 1, 12), 0, "address"),
+                  Order(5, datetime(2024, 1, 1, 12), '7', "address"),
+                  Order(1, datetime(2024, 1, 1, 12), 10, "address")]
+        dishes = [Dish(1, 'pho!', 10, True), Dish(2, 'pho', 10, True), Dish(3, 'pasta', 0.01, True),
+                  Dish(4, 'pasta', 0, True), Dish(5, 'pasta', '12', True), Dish(6, 'pasta', 10, None),
+                  Dish(1, 'pasta', 10, True)]
+
+        single = ([Solution.add_customer(customer) for customer in customers],
+                  [Solution.add_order(order) for order in orders],
+                  [Solution.add_dish(dish) for dish in dishes])
+        Solution.clear_tables()
+        bulk = (Solution.add_customers(customers), Solution.add_orders(orders), Solution.add_dishes(dishes))
+        self.assertEqual(single[0], bulk[0], 'test 20.1')
+        self.assertEqual(single[1], bulk[1], 'test 20.2')
+        self.assertEqual(single[2], bulk[2], 'test 20.3')
+        self.assertEqual(Customer(4, 'name', 25, "0123456789"), Solution.get_customer(4), 'test 20.4')
+
+    def test_similarity_disjoint_writers(self) -> None:
+        for cust_id in range(1, 4):
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(cust_id, 'name', 21, "0123456789")),
+                             'test 21.1')
+            self.assertEqual(ReturnValue.OK, Solution.add_dish(Dish(cust_id, f'dish {cust_id}', 10, True)),
+                             'test 21.2')
+        results = []
+
+        # a low rating and a high rating in another component do not wait for the open transaction
+        def other_writer():
+            results.append(Solution.customer_rated_dish(2, 2, 2))
+            results.append(Solution.customer_rated_dish(3, 3, 5))
+
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.customer_rated_dish(1, 1, 5), 'test 21.3')
+            writer = threading.Thread(target=other_writer)
+            writer.start()
+            writer.join(timeout=10)
+            self.assertEqual(False, writer.is_alive(), 'test 21.4')
+        self.assertEqual([ReturnValue.OK, ReturnValue.OK], results, 'test 21.5')
+        self.assertEqual([], Solution.get_potential_dish_recommendations(3), 'test 21.6')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
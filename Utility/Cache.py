@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# returned by LRUCache.get when the key is not cached
+MISSING = object()
+
+
+# a bounded, thread-safe LRU map with an optional time to live (in seconds) per entry
+class LRUCache:
+    def __init__(self, max_size=1024, ttl: Optional[float] = None):
+        if max_size < 0:
+            raise ValueError("max_size must not be negative")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__entries = OrderedDict()  # key -> (value, time stored)
+        self.__lock = threading.Lock()
+        self.__invalidations = 0
+        self.__stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key, default=MISSING):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__stats['misses'] += 1
+                return default
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self.__entries[key]
+                self.__stats['expirations'] += 1
+                self.__stats['misses'] += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.__stats['hits'] += 1
+            return value
+
+    # take a token before reading the value from the database and pass it to put():
+    # if anything was invalidated in between, the (possibly stale) value is not stored
+    def token(self) -> int:
+        with self.__lock:
+            return self.__invalidations
+
+    def put(self, key, value, token: Optional[int] = None) -> None:
+        with self.__lock:
+            if self.max_size == 0 or (token is not None and token != self.__invalidations):
+                return
+            self.__entries[key] = (value, time.monotonic())
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__stats['evictions'] += 1
+
+    def invalidate(self, key) -> None:
+        with self.__lock:
+            self.__invalidations += 1
+            if self.__entries.pop(key, None) is not None:
+                self.__stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__invalidations += 1
+            self.__stats['invalidations'] += len(self.__entries)
+            self.__entries.clear()
+
+    def resize(self, max_size: int, ttl: Optional[float] = None) -> None:
+        with self.__lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__stats['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['size'] = len(self.__entries)
+            stats['max_size'] = self.max_size
+            return stats
@@ -1,9 +1,18 @@
 import psycopg2
-from psycopg2 import errors, sql
+from psycopg2 import errors, sql, extras
 from configparser import ConfigParser
 from Utility.Exceptions import DatabaseException
+import io
+import itertools
 import os
-from typing import Union
+import select
+from datetime import date, datetime
+from decimal import Decimal
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Union, Optional
 
 
 class ResultSetDict(dict):
@@ -13,17 +22,59 @@ class ResultSetDict(dict):
         return super().__getitem__(item.lower())
 
 
+# a read-only view of one row of a ResultSet: the fetched tuple plus the column map shared by all rows,
+# supports the same row['col'] access as ResultSetDict without building a dict per row
+class ResultSetRow(Mapping):
+    __slots__ = ('_values', '_cols')
+
+    def __init__(self, values: tuple, cols: ResultSetDict):
+        self._values = values
+        self._cols = cols
+
+    def __getitem__(self, item):
+        if type(item) is not str:
+            return None
+        return self._values[self._cols[item]]
+
+    def __iter__(self):
+        return iter(self._cols)
+
+    def __len__(self):
+        return len(self._cols)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# numpy dtype of a ResultSet column by the PostgreSQL type OID of its description, for columns without values
+NUMPY_DTYPES = {
+    16: 'bool',                                         # boolean
+    20: 'int64', 21: 'int64', 23: 'int64',              # bigint, smallint, integer
+    700: 'float64', 701: 'float64', 1700: 'float64',    # real, double precision, numeric
+    1082: 'datetime64[D]',                              # date
+    1114: 'datetime64[us]',                             # timestamp
+}
+
+
 class ResultSet:
     # constructor
-    def __init__(self, description=None, results=None):
+    # with lazy_rows (the default) the fetched tuples are kept as they are and rows are returned as ResultSetRow views,
+    # otherwise the results are copied and every row access builds a ResultSetDict
+    def __init__(self, description=None, results=None, lazy_rows=True):
         self.rows = []
         self.cols_header = []
+        self.cols_types = []
         self.cols = ResultSetDict()
+        self.lazy_rows = lazy_rows
         self.__fromQuery(description, results)
 
     def __getitem__(self, idx):
         if type(idx) == str:
-            return [x[self.cols[idx]] for x in self.rows]
+            # the column is only looked up when there are rows, an empty result gives [] for any name
+            if not self.rows:
+                return []
+            col = self.cols[idx]
+            return [x[col] for x in self.rows]
         return self.__getRow(idx)
 
     # so you can use print(ResultSet)
@@ -39,8 +90,52 @@ class ResultSet:
         return string
 
     def __iter__(self):
-        for row in range(len(self.rows)):
-            yield self.__getRow(row)
+        if self.lazy_rows:
+            cols = self.cols
+            for row in self.rows:
+                yield ResultSetRow(row, cols)
+        else:
+            for row in range(len(self.rows)):
+                yield self.__getRow(row)
+
+    # the result as {column name: list of values}, transposed in a single pass over the rows
+    def to_columns(self) -> dict:
+        if not self.rows:
+            return {col: [] for col in self.cols_header}
+        return {col: list(values) for col, values in zip(self.cols_header, zip(*self.rows))}
+
+    # the result as {column name: numpy array}, typed by the column's values:
+    # integers -> int64 (float64 with NaN if the column has NULLs), DECIMAL / float -> float64,
+    # timestamps -> datetime64[us], dates -> datetime64[D], booleans -> bool, anything else -> object.
+    # a column without any value (empty result or only NULLs) is typed by its PostgreSQL type instead
+    def to_numpy(self) -> dict:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("ResultSet.to_numpy requires numpy to be installed")
+
+        arrays = {}
+        for col, type_code, values in zip(self.cols_header, self.cols_types, self.to_columns().values()):
+            sample = next((val for val in values if val is not None), None)
+            has_nulls = any(val is None for val in values)
+            if sample is None:
+                dtype = NUMPY_DTYPES.get(type_code, object)
+                if has_nulls and dtype in ('int64', 'bool'):
+                    dtype = 'float64' if dtype == 'int64' else object
+            elif isinstance(sample, bool):
+                dtype = object if has_nulls else np.bool_
+            elif isinstance(sample, int):
+                dtype = np.float64 if has_nulls else np.int64
+            elif isinstance(sample, (Decimal, float)):
+                dtype = np.float64
+            elif isinstance(sample, datetime):
+                dtype = 'datetime64[us]'
+            elif isinstance(sample, date):
+                dtype = 'datetime64[D]'
+            else:
+                dtype = object
+            arrays[col] = np.array(values, dtype=dtype)
+        return arrays
 
     # what is the size of the ResultSet?
     def size(self):
@@ -54,20 +149,28 @@ class ResultSet:
         if len(self.rows) <= row:
             print('Invalid row ' + str(row))
             return ResultSetDict()
+        if self.lazy_rows:
+            return ResultSetRow(self.rows[row], self.cols)
         row_to_return = ResultSetDict()
         for val, col in zip(self.rows[row], self.cols_header):
             row_to_return[col] = val
         return row_to_return
 
     def __fromQuery(self, description, results: list):
-        if results is None or len(results) == 0:  # no results
-            self.cols = ResultSetDict()
-        else:
-            self.rows = results.copy()
+        # the header comes from the description, so an empty result still knows its columns
+        if description is not None:
             self.cols_header = [d.name for d in description]
-            self.cols = ResultSetDict()
-            for col, index in zip(self.cols_header, range(len(results[0]))):
+            self.cols_types = [d.type_code for d in description]
+            for index, col in enumerate(self.cols_header):
                 self.cols[col] = index
+        if results is not None and len(results) > 0:
+            # the lazy mode owns the list handed over by fetchall(), no need to copy it
+            self.rows = results if self.lazy_rows else results.copy()
+
+
+# rows fetched per round trip by DBConnector.execute_stream
+STREAM_ITERSIZE = 2000
+_stream_ids = itertools.count()
 
 
 class DBConnector:
@@ -75,15 +178,34 @@ class DBConnector:
     def __init__(self):
         try:
             # Obtain the configuration parameters
-            params = DBConnector.__config()
+            params = load_config()
             self.connection = psycopg2.connect(**params)
             self.connection.autocommit = False
             self.cursor = self.connection.cursor()
+            # names of the registered statements already PREPAREd on this connection
+            self.prepared = set()
+            # whether the session's pg_temp.run_batch function exists, see execute_batch()
+            self.batch_ready = False
+            # explicit transaction state, see transaction() and savepoint()
+            self.in_transaction = False
+            self.savepoints = []
         except Exception as e:
             self.connection = None
             self.cursor = None
             raise DatabaseException.ConnectionInvalid("Could not connect to database")
 
+    # is the underlying connection still usable? (cheap round trip to the server)
+    def is_alive(self) -> bool:
+        if self.connection is None or self.connection.closed:
+            return False
+        try:
+            self.cursor.execute("SELECT 1")
+            self.cursor.fetchall()
+            self.connection.rollback()
+            return True
+        except Exception:
+            return False
+
     # close connection
     def close(self):
         if self.cursor is not None:
@@ -107,25 +229,64 @@ class DBConnector:
             except Exception:
                 raise DatabaseException.ConnectionInvalid("Could not rollback changes")
 
+    # groups every statement executed inside the with block into one transaction:
+    # commits when the block ends, rolls back if it raises. a nested block becomes a savepoint
+    @contextmanager
+    def transaction(self):
+        if self.in_transaction:
+            with self.savepoint():
+                yield self
+            return
+
+        self.in_transaction = True
+        try:
+            yield self
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+            self.savepoints.clear()
+
+    # statements executed inside the with block are undone on their own if the block raises,
+    # the rest of the surrounding transaction stays intact
+    @contextmanager
+    def savepoint(self):
+        name = sql.Identifier(f'sp_{len(self.savepoints)}')
+        self.cursor.execute(sql.SQL("SAVEPOINT {}").format(name))
+        self.savepoints.append(name)
+        try:
+            yield self
+            self.cursor.execute(sql.SQL("RELEASE SAVEPOINT {}").format(name))
+        except BaseException:
+            self.cursor.execute(sql.SQL("ROLLBACK TO SAVEPOINT {}").format(name))
+            raise
+        finally:
+            self.savepoints.pop()
+
+    # undo the failed statement: back to the innermost savepoint, or the whole transaction if there is none
+    def rollback_statement(self):
+        if len(self.savepoints) > 0:
+            try:
+                self.cursor.execute(sql.SQL("ROLLBACK TO SAVEPOINT {}").format(self.savepoints[-1]))
+            except Exception:
+                raise DatabaseException.ConnectionInvalid("Could not rollback to savepoint")
+        else:
+            self.rollback()
+
     # executes the query, if it is SELECT you may ask to print the results with printSchema
+    # nothing is committed, call commit() or run the statements inside transaction()
+    # params are bound to the %s placeholders of the query by psycopg2
     # returns the number of rows effected and a ResultSet (for SELECT)
-    def execute(self, query: Union[str, sql.Composed], printSchema=False) -> (int, ResultSet):
+    def execute(self, query: Union[str, sql.Composed], printSchema=False, params=None) -> (int, ResultSet):
         if self.connection is None:
             raise DatabaseException.ConnectionInvalid("Connection Invalid")
 
         # try to execute the query
-        try:
-            self.cursor.execute(query)
+        with DBConnector.__translate_errors():
+            self.cursor.execute(query, params)
             row_effected = max(self.cursor.rowcount, 0)
-            self.commit()
-        except errors.lookup("23502"):
-            raise DatabaseException.NOT_NULL_VIOLATION("NOT_NULL_VIOLATION")
-        except errors.lookup("23503"):
-            raise DatabaseException.FOREIGN_KEY_VIOLATION("FOREIGN_KEY_VIOLATION")
-        except errors.lookup("23505"):
-            raise DatabaseException.UNIQUE_VIOLATION("UNIQUE_VIOLATION")
-        except errors.lookup("23514"):
-            raise DatabaseException.CHECK_VIOLATION("CHECK_VIOLATION")
 
         # get entries in case of SELECT
         if self.cursor.description is not None:
@@ -139,25 +300,515 @@ class DBConnector:
 
         return row_effected, entries
 
-    # grant credentials
+    # executes a SELECT on a named (server side) cursor and yields its rows as ResultSetRow views,
+    # itersize rows are fetched per round trip so the whole result is never held in memory.
+    # the cursor lives in the current transaction, do not commit before the generator is exhausted or closed
+    def execute_stream(self, query: Union[str, sql.Composed], params=None, itersize=STREAM_ITERSIZE):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        cursor = self.connection.cursor(name=f'stream_{next(_stream_ids)}')
+        cursor.itersize = itersize
+        try:
+            with DBConnector.__translate_errors():
+                cursor.execute(query, params)
+            cols = None
+            for row in cursor:
+                if cols is None:
+                    cols = ResultSetDict()
+                    for index, d in enumerate(cursor.description):
+                        cols[d.name] = index
+                yield ResultSetRow(row, cols)
+        finally:
+            cursor.close()
+
+    # inserts many rows in one statement, the query must contain a single "VALUES %s" which psycopg2
+    # expands into multi-row VALUES lists of page_size rows each
+    # returns the number of rows returned by the query's RETURNING clause and a ResultSet of them
+    def execute_values(self, query: Union[str, sql.Composed], rows: list, page_size=1000) -> (int, ResultSet):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        with DBConnector.__translate_errors():
+            returned = extras.execute_values(self.cursor, query, rows, page_size=page_size, fetch=True)
+
+        if self.cursor.description is not None:
+            return len(returned), ResultSet(self.cursor.description, returned)
+        return 0, ResultSet()
+
+    # streams rows into table (columns in the given order) with COPY FROM STDIN, None is sent as NULL
+    # returns the number of rows copied
+    def copy_rows(self, table: str, columns: list, rows) -> int:
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join('\\N' if val is None else DBConnector.__copy_escape(str(val)) for val in row))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.SQL(table), sql.SQL(', ').join(sql.SQL(col) for col in columns))
+        with DBConnector.__translate_errors():
+            self.cursor.copy_expert(query, buffer)
+        return max(self.cursor.rowcount, 0)
+
+    @staticmethod
+    def __copy_escape(val: str) -> str:
+        return val.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    # map the integrity errors raised by psycopg2 to our DatabaseException types
     @staticmethod
-    def __config(filename=os.path.join(os.path.join(os.getcwd(), "Utility"), 'database.ini'),
-                 section='postgresql'):
-        # create a parser
+    @contextmanager
+    def __translate_errors():
+        try:
+            yield
+        except errors.lookup("23502"):
+            raise DatabaseException.NOT_NULL_VIOLATION("NOT_NULL_VIOLATION")
+        except errors.lookup("23503"):
+            raise DatabaseException.FOREIGN_KEY_VIOLATION("FOREIGN_KEY_VIOLATION")
+        except errors.lookup("23505"):
+            raise DatabaseException.UNIQUE_VIOLATION("UNIQUE_VIOLATION")
+        except errors.lookup("23514"):
+            raise DatabaseException.CHECK_VIOLATION("CHECK_VIOLATION")
+
+    # executes a statement from the registry (see register_statement) with bound parameters.
+    # the statement is PREPAREd the first time it is used on this connection and EXECUTEd afterwards,
+    # so the server parses and plans it once per connection instead of once per call
+    def execute_prepared(self, name: str, params=(), printSchema=False) -> (int, ResultSet):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        if name not in _statements:
+            raise DatabaseException.UNKNOWN_ERROR(f"Unknown prepared statement {name}")
+
+        query = sql.SQL("EXECUTE {}").format(sql.Identifier(name))
+        if len(params) > 0:
+            query += sql.SQL("({})").format(sql.SQL(', ').join(sql.Placeholder() * len(params)))
+
+        for attempt in range(2):
+            if name not in self.prepared:
+                self.cursor.execute(sql.SQL("PREPARE {} AS ").format(sql.Identifier(name)) + sql.SQL(_statements[name]))
+                self.prepared.add(name)
+            try:
+                return self.execute(query, printSchema, tuple(params))
+            except errors.lookup("26000"):
+                # the server does not know the statement any more (e.g. the session was reset),
+                # forget what we prepared on this connection and prepare it again
+                if attempt > 0:
+                    raise
+                self.rollback_statement()
+                self.prepared.clear()
+            except errors.lookup("0A000"):
+                # "cached plan must not change result type" - a table was recreated with other columns
+                if attempt > 0:
+                    raise
+                self.rollback_statement()
+                self.cursor.execute(sql.SQL("DEALLOCATE {}").format(sql.Identifier(name)))
+                self.prepared.discard(name)
+
+
+    # executes every query of the list in one round trip, each in its own subtransaction (see BATCH_FUNCTION):
+    # a failing query only undoes itself and the following ones still run. nothing is committed.
+    # returns one (rows effected, exception or None) pair per query, the exceptions being the ones execute()
+    # would have raised for that query. the results of SELECT queries are discarded
+    def execute_batch(self, queries: list) -> list:
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        if len(queries) == 0:
+            return []
+
+        texts = [query.as_string(self.connection) if isinstance(query, sql.Composable) else query
+                 for query in queries]
+        for attempt in range(2):
+            if not self.batch_ready:
+                self.cursor.execute(BATCH_FUNCTION)
+                self.batch_ready = True
+            try:
+                self.cursor.execute("SELECT state, rows_effected, message FROM pg_temp.run_batch(%s)", (texts,))
+                break
+            except errors.lookup("42883"):
+                # the function was created in a transaction that was rolled back since
+                if attempt > 0:
+                    raise
+                self.rollback_statement()
+                self.batch_ready = False
+
+        return [(rows_effected, None if state is None else batch_exception(state, message))
+                for state, rows_effected, message in self.cursor.fetchall()]
+
+
+# ------------------------------- batched execution -------------------------------
+# session-local (pg_temp) function executing a list of statements, one subtransaction per statement.
+# reports the SQLSTATE and message of a failed statement instead of raising, so one call returns them all
+BATCH_FUNCTION = '''
+CREATE OR REPLACE FUNCTION pg_temp.run_batch(statements TEXT[],
+                                             OUT state TEXT, OUT rows_effected BIGINT, OUT message TEXT)
+RETURNS SETOF RECORD AS $$
+DECLARE
+    query_text TEXT;
+BEGIN
+    FOREACH query_text IN ARRAY statements LOOP
+        BEGIN
+            EXECUTE query_text;
+            GET DIAGNOSTICS rows_effected = ROW_COUNT;
+            state := NULL;
+            message := NULL;
+        EXCEPTION WHEN OTHERS THEN
+            rows_effected := 0;
+            state := SQLSTATE;
+            message := SQLERRM;
+        END;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+# SQLSTATE -> the DatabaseException execute() raises for it
+SQLSTATE_EXCEPTIONS = {
+    '23502': DatabaseException.NOT_NULL_VIOLATION,
+    '23503': DatabaseException.FOREIGN_KEY_VIOLATION,
+    '23505': DatabaseException.UNIQUE_VIOLATION,
+    '23514': DatabaseException.CHECK_VIOLATION,
+}
+
+
+# the exception a failed statement of a batch would have raised when executed on its own
+def batch_exception(state: str, message: str) -> Exception:
+    if state in SQLSTATE_EXCEPTIONS:
+        exception = SQLSTATE_EXCEPTIONS[state]
+        return exception(exception.__name__)
+    try:
+        return errors.lookup(state)(message)
+    except KeyError:
+        return DatabaseException.UNKNOWN_ERROR(message)
+
+
+# ------------------------------- prepared statements registry -------------------------------
+# statement name -> SQL text using $1, $2, ... parameters, shared by every connection
+_statements = {}
+
+
+def register_statement(name: str, query: str) -> None:
+    if name in _statements and _statements[name] != query:
+        raise ValueError(f"Statement {name} is already registered with a different query")
+    _statements[name] = query
+
+
+# ------------------------------- database.ini configuration -------------------------------
+# environment variables which override the values read from database.ini
+CONFIG_ENV_OVERRIDES = {
+    'PGHOST': 'host',
+    'PGPORT': 'port',
+    'PGDATABASE': 'database',
+    'PGUSER': 'user',
+    'PGPASSWORD': 'password',
+}
+
+_config_files_cache = {}  # (filename, mtime, section) -> parsed section
+_resolved_config = {}     # section -> connection parameters handed to psycopg2.connect
+_config_lock = threading.Lock()
+
+
+# database.ini is looked up under Utility in the working directory, then in its parent directory
+def _config_file_candidates():
+    return [os.path.join(os.path.join(os.getcwd(), "Utility"), 'database.ini'),
+            os.path.join(os.path.join(os.path.dirname(os.getcwd()), 'Utility'), 'database.ini')]
+
+
+def _read_config_file(filename, section) -> Optional[dict]:
+    try:
+        mtime = os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+    key = (filename, mtime, section)
+    if key not in _config_files_cache:
         parser = ConfigParser()
-        # read config file
         parser.read(filename)
+        if not parser.has_section(section):
+            return None
+        _config_files_cache[key] = dict(parser.items(section))
+    return _config_files_cache[key]
 
-        # get section
-        db = {}
-        if parser.has_section(section):
-            params = parser.items(section)
-            for param in params:
-                db[param[0]] = param[1]
-        else:
-            # file not found
-            db = DBConnector.__config(
-                filename=os.path.join(os.path.join(os.path.dirname(os.getcwd()), 'Utility'), 'database.ini'))
-            if db is None:
-                raise DatabaseException.database_ini_ERROR("Please modify database.ini file under Utility")
-        return db
+
+def _resolve_config(section) -> dict:
+    db = None
+    for filename in _config_file_candidates():
+        db = _read_config_file(filename, section)
+        if db is not None:
+            break
+
+    overrides = {param: os.environ[env] for env, param in CONFIG_ENV_OVERRIDES.items() if env in os.environ}
+    if db is None and not overrides:
+        raise DatabaseException.database_ini_ERROR("Please modify database.ini file under Utility")
+    db = dict(db or {})
+    db.update(overrides)
+    return db
+
+
+# connection parameters, the file is read only the first time a section is requested
+def load_config(section='postgresql') -> dict:
+    with _config_lock:
+        if section not in _resolved_config:
+            _resolved_config[section] = _resolve_config(section)
+        return dict(_resolved_config[section])
+
+
+# forget the resolved configuration so the next connection resolves it again (e.g. after editing
+# database.ini or the PG* environment variables), files whose mtime did not change are not parsed
+# again unless force is set
+def reload_config(force=False) -> None:
+    with _config_lock:
+        if force:
+            _config_files_cache.clear()
+        _resolved_config.clear()
+
+
+class ConnectionPool:
+    # a bounded, thread-safe pool of DBConnector objects.
+    # min_size connections are opened eagerly, at most max_size connections exist at any time,
+    # connections idle for more than idle_timeout seconds are closed (down to min_size),
+    # a borrower waits up to checkout_timeout seconds for a free connection, and connections
+    # idle for more than health_check_after seconds are pinged before being handed out.
+    def __init__(self, min_size=1, max_size=10, idle_timeout=300.0, checkout_timeout=30.0,
+                 health_check_after=5.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size bounds")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.__idle = []  # list of (DBConnector, time returned to the pool)
+        self.__size = 0
+        self.__closed = False
+        self.__condition = threading.Condition(threading.Lock())
+        self.__stats = {'checkouts': 0, 'waits': 0, 'creations': 0, 'discarded': 0, 'expired': 0}
+        for _ in range(min_size):
+            self.__idle.append((DBConnector(), time.monotonic()))
+            self.__size += 1
+            self.__stats['creations'] += 1
+
+    @staticmethod
+    def __discard(connector: DBConnector):
+        try:
+            connector.close()
+        except Exception:
+            pass
+
+    # close connections which were idle for too long, keeping at least min_size open
+    # must be called while holding the pool lock
+    def __expire_idle(self):
+        now = time.monotonic()
+        keep = []
+        for connector, returned_at in self.__idle:
+            if now - returned_at > self.idle_timeout and self.__size > self.min_size:
+                self.__discard(connector)
+                self.__size -= 1
+                self.__stats['expired'] += 1
+            else:
+                keep.append((connector, returned_at))
+        self.__idle = keep
+
+    # borrow a connection from the pool, the returned connection passed a health check
+    def acquire(self) -> DBConnector:
+        deadline = time.monotonic() + self.checkout_timeout
+        needs_ping = False
+        with self.__condition:
+            waited = False
+            while True:
+                if self.__closed:
+                    raise DatabaseException.ConnectionInvalid("Connection pool is closed")
+                self.__expire_idle()
+                if self.__idle:
+                    connector, returned_at = self.__idle.pop()
+                    needs_ping = time.monotonic() - returned_at > self.health_check_after
+                    break
+                if self.__size < self.max_size:
+                    connector = None
+                    self.__size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DatabaseException.ConnectionInvalid("Timed out waiting for a pooled connection")
+                if not waited:
+                    self.__stats['waits'] += 1
+                    waited = True
+                self.__condition.wait(remaining)
+
+        # connect / health check outside the lock, the slot is already reserved for us
+        try:
+            if connector is not None and (connector.connection.closed or (needs_ping and not connector.is_alive())):
+                self.__discard(connector)
+                with self.__condition:
+                    self.__stats['discarded'] += 1
+                connector = None
+            if connector is None:
+                connector = DBConnector()
+                with self.__condition:
+                    self.__stats['creations'] += 1
+        except Exception:
+            with self.__condition:
+                self.__size -= 1
+                self.__condition.notify()
+            raise
+
+        with self.__condition:
+            self.__stats['checkouts'] += 1
+        return connector
+
+    # return a borrowed connection, any uncommitted work is rolled back
+    def release(self, connector: DBConnector):
+        healthy = connector.connection is not None and not connector.connection.closed
+        if healthy:
+            try:
+                connector.connection.rollback()
+            except Exception:
+                healthy = False
+
+        with self.__condition:
+            if healthy and not self.__closed:
+                self.__idle.append((connector, time.monotonic()))
+            else:
+                self.__discard(connector)
+                self.__size -= 1
+                if not healthy:
+                    self.__stats['discarded'] += 1
+            self.__condition.notify()
+
+    # with pool.connection() as conn: ...
+    @contextmanager
+    def connection(self):
+        connector = self.acquire()
+        try:
+            yield connector
+        finally:
+            self.release(connector)
+
+    # pool statistics for monitoring
+    def stats(self) -> dict:
+        with self.__condition:
+            stats = dict(self.__stats)
+            stats['size'] = self.__size
+            stats['idle'] = len(self.__idle)
+            stats['in_use'] = self.__size - len(self.__idle)
+            return stats
+
+    # close every idle connection and refuse further checkouts
+    def close(self):
+        with self.__condition:
+            self.__closed = True
+            for connector, _ in self.__idle:
+                self.__discard(connector)
+            self.__size -= len(self.__idle)
+            self.__idle = []
+            self.__condition.notify_all()
+
+
+# module level pool, created lazily on first use
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+POOL_IDLE_TIMEOUT = 300.0
+POOL_CHECKOUT_TIMEOUT = 30.0
+POOL_HEALTH_CHECK_AFTER = 5.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_IDLE_TIMEOUT, POOL_CHECKOUT_TIMEOUT,
+                                   POOL_HEALTH_CHECK_AFTER)
+        return _pool
+
+
+# replace the module pool (e.g. with different bounds), the old pool is closed
+def configure_pool(min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                   checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                   health_check_after=POOL_HEALTH_CHECK_AFTER) -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(min_size, max_size, idle_timeout, checkout_timeout, health_check_after)
+        return _pool
+
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
+# the max_size of the module pool without creating it (creating it opens POOL_MIN_SIZE connections)
+def pool_max_size() -> int:
+    with _pool_lock:
+        return _pool.max_size if _pool is not None else POOL_MAX_SIZE
+
+
+# ------------------------------- LISTEN / NOTIFY -------------------------------
+class NotificationListener:
+    # a daemon thread holding its own autocommit connection that LISTENs on channel and passes the payload of
+    # every notification to callback(payload). notifications sent while the listener is disconnected are lost,
+    # so on_connect() is called every time the LISTEN is (re)established, before any notification is delivered
+    def __init__(self, channel: str, callback, on_connect=None, poll_timeout=1.0, reconnect_delay=1.0):
+        self.channel = channel
+        self.callback = callback
+        self.on_connect = on_connect
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__stats = {'notifications': 0, 'connects': 0, 'errors': 0}
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name=f'listen-{self.channel}', daemon=True)
+        self.__thread.start()
+
+    def stop(self, timeout=None) -> None:
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def is_running(self) -> bool:
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def stats(self) -> dict:
+        return dict(self.__stats)
+
+    def __run(self):
+        while not self.__stop.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(**load_config())
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                if self.on_connect is not None:
+                    self.on_connect()
+                # counted once on_connect has run, so a caller seeing the count knows the LISTEN is in place
+                self.__stats['connects'] += 1
+
+                while not self.__stop.is_set():
+                    if select.select([connection], [], [], self.poll_timeout) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.__stats['notifications'] += 1
+                        self.callback(notification.payload)
+            except Exception:
+                self.__stats['errors'] += 1
+                self.__stop.wait(self.reconnect_delay)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass